@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from bot.outbound import outbound_priority, PRIORITY_BROADCAST
+from config import settings
+from database.crud import BroadcastCRUD
+from database.database import async_session_maker
+from database.models import BroadcastStatus
+from utils.rate_limit import TokenBucket
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+def classify_failure(error: Exception) -> str:
+    """Причина недоставки для отчёта по рассылке"""
+    text = str(error).lower()
+    if isinstance(error, TelegramForbiddenError):
+        return "deactivated" if "deactivated" in text else "blocked"
+    if isinstance(error, TelegramBadRequest) and "chat not found" in text:
+        return "not_found"
+    return "error"
+
+
+class BroadcastEngine:
+    """
+    Рассылка сообщения администратора всем пользователям.
+
+    - получатели читаются из users серверным курсором пачками по chunk_size;
+    - отправка ограничена своим token bucket (rate) ниже глобального лимита,
+      чтобы оставить место игровым сообщениям, и идёт с низким приоритетом
+      через планировщик исходящих сообщений;
+    - после каждой пачки прогресс (последний users.id) и неудачные доставки
+      фиксируются в БД — прерванную рассылку можно продолжить (/broadcast_resume),
+      повторно получит сообщение не больше одной пачки.
+    """
+
+    def __init__(self, rate: float = 20.0, concurrency: int = 20, chunk_size: int = 500):
+        self.rate = rate
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._cancelled = False
+
+        # Прогресс текущей рассылки
+        self.broadcast_id: Optional[int] = None
+        self.sent = 0
+        self.failed = 0
+        self.failures_by_reason: dict = {}
+        self.started_at: Optional[float] = None
+        self._processed_this_run = 0
+
+    def set_bot(self, bot: Bot) -> None:
+        self._bot = bot
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start_new(self, text: str) -> int:
+        """Создать рассылку и запустить её в фоне"""
+        if self.is_running:
+            raise RuntimeError("Рассылка уже идёт")
+        async with async_session_maker() as session:
+            broadcast = await BroadcastCRUD.create(session, text)
+        self._launch(broadcast.id, broadcast.text, 0, 0, 0)
+        return broadcast.id
+
+    async def resume(self) -> Optional[int]:
+        """Продолжить последнюю незавершённую рассылку с чекпоинта"""
+        if self.is_running:
+            raise RuntimeError("Рассылка уже идёт")
+        async with async_session_maker() as session:
+            broadcast = await BroadcastCRUD.get_resumable(session)
+            if broadcast is None:
+                return None
+            await BroadcastCRUD.set_status(session, broadcast.id, BroadcastStatus.RUNNING)
+        self._launch(broadcast.id, broadcast.text, broadcast.last_user_id, broadcast.sent, broadcast.failed)
+        return broadcast.id
+
+    def cancel(self) -> bool:
+        """Остановить текущую рассылку после текущей пачки"""
+        if not self.is_running:
+            return False
+        self._cancelled = True
+        return True
+
+    def _launch(self, broadcast_id: int, text: str, after_user_id: int, sent: int, failed: int) -> None:
+        if self._bot is None:
+            raise RuntimeError("bot не инициализирован")
+        self.broadcast_id = broadcast_id
+        self.sent = sent
+        self.failed = failed
+        self.failures_by_reason = {}
+        self.started_at = time.monotonic()
+        self._processed_this_run = 0
+        self._cancelled = False
+        self._task = asyncio.create_task(self._run(broadcast_id, text, after_user_id))
+        logger.info(f"Рассылка {broadcast_id} запущена с users.id > {after_user_id}")
+
+    async def _send(self, telegram_id: int, text: str,
+                    limiter: TokenBucket, semaphore: asyncio.Semaphore) -> Optional[Tuple[str, str]]:
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                with outbound_priority(PRIORITY_BROADCAST):
+                    await self._bot.send_message(telegram_id, text, parse_mode="HTML")
+                return None
+            except Exception as e:
+                return classify_failure(e), str(e)[:500]
+
+    async def _run(self, broadcast_id: int, text: str, after_user_id: int) -> None:
+        limiter = TokenBucket(self.rate, self.rate)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        status = BroadcastStatus.COMPLETED
+        shutdown = False
+        try:
+            async with async_session_maker() as stream_session, async_session_maker() as session:
+                async for chunk in BroadcastCRUD.stream_recipients(stream_session, after_user_id, self.chunk_size):
+                    results = await asyncio.gather(
+                        *(self._send(telegram_id, text, limiter, semaphore) for _, telegram_id in chunk)
+                    )
+
+                    failures: List[Tuple[int, str, str]] = []
+                    for (_, telegram_id), failure in zip(chunk, results):
+                        if failure is None:
+                            self.sent += 1
+                        else:
+                            self.failed += 1
+                            self.failures_by_reason[failure[0]] = self.failures_by_reason.get(failure[0], 0) + 1
+                            failures.append((telegram_id, failure[0], failure[1]))
+                    self._processed_this_run += len(chunk)
+
+                    await BroadcastCRUD.checkpoint(
+                        session, broadcast_id, chunk[-1][0], self.sent, self.failed, failures
+                    )
+                    if self._cancelled:
+                        status = BroadcastStatus.CANCELLED
+                        break
+        except asyncio.CancelledError:
+            status = BroadcastStatus.INTERRUPTED
+            shutdown = True
+            raise
+        except Exception as e:
+            status = BroadcastStatus.INTERRUPTED
+            logger.error(f"Рассылка {broadcast_id} прервана: {e}", exc_info=True)
+        finally:
+            async with async_session_maker() as session:
+                await BroadcastCRUD.set_status(session, broadcast_id, status)
+            logger.info(f"Рассылка {broadcast_id}: {status.value}, {self.stats()}")
+            if not shutdown:
+                await self._report(broadcast_id, status)
+
+    async def _report(self, broadcast_id: int, status: BroadcastStatus) -> None:
+        if not settings.admin_id:
+            return
+        stats = self.stats()
+        reasons = ", ".join(f"{reason}: {count}" for reason, count in self.failures_by_reason.items()) or "—"
+        try:
+            await self._bot.send_message(
+                int(settings.admin_id),
+                f"📣 Рассылка #{broadcast_id}: <b>{status.value}</b>\n"
+                f"Доставлено: {stats['sent']}, не доставлено: {stats['failed']} ({reasons})\n"
+                f"Скорость: {stats['per_sec']} сообщ./с",
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось отправить отчёт о рассылке: {e}")
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "broadcast_id": self.broadcast_id,
+            "running": self.is_running,
+            "sent": self.sent,
+            "failed": self.failed,
+            "failures_by_reason": self.failures_by_reason,
+            "per_sec": round(self._processed_this_run / elapsed, 1) if elapsed else 0.0,
+        }
+
+    async def stop(self) -> None:
+        """Остановка приложения: рассылка помечается прерванной и продолжается после рестарта командой"""
+        if self.is_running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+# Глобальный движок рассылок
+broadcaster = BroadcastEngine(
+    rate=settings.BROADCAST_RATE,
+    concurrency=settings.BROADCAST_CONCURRENCY,
+    chunk_size=settings.BROADCAST_CHUNK_SIZE,
+)
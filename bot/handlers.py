@@ -1,48 +1,39 @@
 from aiogram import Router, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 import uuid
 import logging
 from datetime import datetime
-from sqlalchemy.sql import text
 from aiocryptopay import Networks
-from asyncio import sleep
+import asyncio
 
 from .keyboards import *
 from .states import BetFlow
+from .metadata import bot_metadata
+from .broadcast import broadcaster
 from game.football import FootballGame
 from database.database import async_session_maker
-from database.crud import UserCRUD, GameCRUD, TransactionCRUD
+from database.crud import UserCRUD, GameCRUD, GameStatsCRUD, TransactionCRUD
 from database.models import GameResult, GameStatus, TransactionStatus
 from payment.cryptobot import cryptobot
-import aiohttp
+from payment.invoice_pool import invoice_pool
+from payment.exchange_rates import usd_to_asset
+from payment.webhook import payment_queue, process_payment
+from utils.work_queue import QueueFullError
 import json
 from config import settings  # убедись, что CRYPTOBOT_TOKEN есть в settings
 
 async def create_invoice_with_return_btn(asset: str, amount: str, description: str, paid_btn_name: str = None, paid_btn_url: str = None):
-    """Создаёт инвойс в CryptoBot вручную с поддержкой paid_btn_*"""
-    url = "https://pay.crypt.bot/api/createInvoice"
-    headers = {
-        "Crypto-Pay-API-Token": settings.cryptobot_token,
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "asset": asset,
-        "amount": amount,
-        "description": description
-    }
-    # Используем ТОЛЬКО разрешённые значения для paid_btn_name
-    if paid_btn_url:
-        payload["paid_btn_name"] = "openBot"      # ← фиксированное значение
-        payload["paid_btn_url"] = paid_btn_url    # ← ссылка на вашего бота
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            data = await resp.json()
-            if not data.get("ok"):
-                raise Exception(f"CryptoBot API error: {data}")
-            return data["result"]
+    """Создаёт инвойс в CryptoBot с поддержкой paid_btn_* (через общий клиент)"""
+    return await cryptobot.create_invoice(
+        asset=asset,
+        amount=amount,
+        description=description,
+        paid_btn_url=paid_btn_url,
+        expires_in=settings.INVOICE_EXPIRES_IN
+    )
+
 router = Router()
 bot_instance = None
 MIN_BET = 0.05
@@ -115,40 +106,25 @@ async def process_currency(callback: CallbackQuery, state: FSMContext):
 
 async def create_game_and_invoice(callback: CallbackQuery, game_type: str, description: str, amount: float, currency: str, state: FSMContext):
     """Создаёт запись игры, инвойс и обновляет существующее сообщение"""
-    async with async_session_maker() as session:
-        user = await UserCRUD.get_or_create(
-            session,
-            telegram_id=callback.from_user.id,
-            username=callback.from_user.username or "Unknown",
-            first_name=callback.from_user.first_name or "User"
-        )
-        game_id = str(uuid.uuid4())
-        game = await GameCRUD.create(
-            session=session,
-            game_id=game_id,
-            user_id=user.id,
-            game_type=game_type,
-            bet_amount=amount,
-            currency=currency
-        )
+    game_id = str(uuid.uuid4())
 
-        # === Получаем username бота для кнопки возврата ===
-        return_url = None
-        try:
-            bot_info = await bot_instance.get_me()
-            bot_username = bot_info.username
-            if bot_username:
-                return_url = f"https://t.me/{bot_username}"
-            else:
-                logger.warning("Бот не имеет username — кнопка возврата недоступна")
-        except Exception as e:
-            logger.error(f"Не удалось получить username бота: {e}")
+    # === Берём готовый счёт из пула (стандартные суммы) ===
+    # Счёт получаем до записи в БД: если CryptoBot недоступен, в БД ничего не остаётся
+    invoice_response = None
+    if settings.INVOICE_POOL_ENABLED:
+        invoice_response = invoice_pool.claim(currency, amount)
+
+    if invoice_response is None:
+        # === Ссылка возврата в бота из кэша метаданных (без запроса getMe) ===
+        return_url = bot_metadata.return_url
+        if not return_url:
+            logger.warning("Бот не имеет username — кнопка возврата недоступна")
 
         # === Создаём инвойс через прямой API-запрос ===
         try:
             invoice_response = await create_invoice_with_return_btn(
                 asset=currency,
-                amount=str(amount),
+                amount=str(usd_to_asset(amount, currency)),
                 description=f"", #сообщение которое выводится в критпобота после оплаты
                 
                 paid_btn_url=return_url
@@ -157,31 +133,52 @@ async def create_game_and_invoice(callback: CallbackQuery, game_type: str, descr
             logger.error(f"Ошибка при создании инвойса через API: {e}")
             raise
 
-        invoice_id = str(invoice_response.get('invoice_id') or invoice_response.get('id') or uuid.uuid4())
-        pay_url = invoice_response.get('bot_invoice_url') or invoice_response.get('pay_url') or invoice_response.get('url')
-        if not pay_url:
-            logger.error("Не удалось получить URL для оплаты")
-            raise ValueError("Не удалось получить URL для оплаты")
+    invoice_id = str(invoice_response.get('invoice_id') or invoice_response.get('id') or uuid.uuid4())
+    pay_url = invoice_response.get('bot_invoice_url') or invoice_response.get('pay_url') or invoice_response.get('url')
+    if not pay_url:
+        logger.error("Не удалось получить URL для оплаты")
+        raise ValueError("Не удалось получить URL для оплаты")
 
+    # Сумма счёта в выбранном активе (ставка хранится в USD)
+    asset_amount = float(invoice_response.get('amount') or usd_to_asset(amount, currency))
+
+    # === Пользователь, игра и транзакция — одной транзакцией БД, один коммит на ставку ===
+    async with async_session_maker() as session:
+        user = await UserCRUD.get_or_create(
+            session,
+            telegram_id=callback.from_user.id,
+            username=callback.from_user.username or "Unknown",
+            first_name=callback.from_user.first_name or "User",
+            commit=False
+        )
+        game = await GameCRUD.create(
+            session=session,
+            game_id=game_id,
+            user_id=user.id,
+            game_type=game_type,
+            bet_amount=amount,
+            currency=currency,
+            commit=False
+        )
         await TransactionCRUD.create(
             session=session,
             user_id=user.id,
             invoice_id=invoice_id,
-            amount=amount,
+            amount=asset_amount,
             currency=currency,
             status=TransactionStatus.PENDING,
-            game_id=game_id,
-            pay_url=pay_url
+            game=game,
+            pay_url=pay_url,
+            commit=False
         )
+        await session.commit()
 
         # Получаем информацию об игре
         game_info = GAME_DESCRIPTIONS.get(game_type, {'emoji': '🎮', 'name': game_type, 'coef': '?'})
 
         # Расчёт комиссии и чистой ставки
-        commission = amount * 0.10
-        net_bet = amount * 0.90
-
-        await session.commit()
+        commission = asset_amount * 0.10
+        net_bet = asset_amount * 0.90
 
         # Сохраняем данные в state
         await state.update_data(
@@ -201,7 +198,7 @@ async def create_game_and_invoice(callback: CallbackQuery, game_type: str, descr
                 f"<b>✅ Счёт создан!</b>\n\n"
                 f"<blockquote>🎮 Игра: <b>{game_info['name']}</b>\n"
                 f"⚡️ Коэффициент: <b>{game_info['coef']}</b>\n"
-                f"💵 Сумма ставки: <b>{amount} {currency}</b>\n"
+                f"💵 Сумма ставки: <b>{asset_amount:g} {currency}</b> ({amount} USD)\n"
                 f"💼 Комиссия казино: <b>{commission:.4f} {currency}</b> (10%)\n"
                 f"🚀 Чистая ставка: <b>{net_bet:.4f} {currency}</b></blockquote>\n\n"
                 f"Оплати счёт по кнопке ниже:",
@@ -216,7 +213,7 @@ async def create_game_and_invoice(callback: CallbackQuery, game_type: str, descr
                 f"<b>Счёт создан!</b>\n\n"
                 f"<blockquote>🎮 Игра: <b>{game_info['name']}</b>\n"
                 f"⚡️ Коэффициент: <b>{game_info['coef']}</b>\n"
-                f"💵 Сумма ставки: <b>{amount} {currency}</b>\n"
+                f"💵 Сумма ставки: <b>{asset_amount:g} {currency}</b> ({amount} USD)\n"
                 f"💼 Комиссия казино: <b>{commission:.4f} {currency}</b> (10%)\n"
                 f"🚀 Чистая ставка: <b>{net_bet:.4f} {currency}</b></blockquote>\n\n"
                 f"Оплати счёт по кнопке ниже:",
@@ -267,14 +264,16 @@ async def check_payment(callback: CallbackQuery, state: FSMContext):
         try:
             invoice_response = await cryptobot.get_invoices(invoice_ids=invoice_id)
             logger.info(f"Ответ от CryptoBot API: {invoice_response}")
-            invoice_data = invoice_response.get("result", [{}])[0]
+            invoice_data = (invoice_response.get("items") or [{}])[0]
             invoice_status = invoice_data.get("status")
 
             if invoice_status != "paid":
+                # amount в FSM — ставка в USD; сумма в активе — из счёта, как при его выставлении
+                asset_amount = float(invoice_data.get("amount") or usd_to_asset(amount, currency))
                 await callback.message.edit_text(
                     f"Ожидаем оплату...\n\n"
                     f"{description}\n\n"
-                    f"💵 Сумма ставки: <b>{amount} {currency}</b>\n"
+                    f"💵 Сумма ставки: <b>{asset_amount:g} {currency}</b> ({amount} USD)\n"
                     f"Статус: <b>Ожидает оплаты</b>",
                     reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
                         InlineKeyboardButton(text="💳 Оплатить", url=pay_url),
@@ -287,56 +286,22 @@ async def check_payment(callback: CallbackQuery, state: FSMContext):
                 return
 
             # Оплата подтверждена
-            await TransactionCRUD.update_status(session, invoice_id, TransactionStatus.PAID)
-            
-            # Получаем игру
-            game = await GameCRUD.get_by_game_id(session, game_id)
-            if not game:
-                logger.error(f"Игра {game_id} не найдена")
-                await callback.message.edit_text(
-                    "Ошибка: игра не найдена.",
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                        InlineKeyboardButton(text="🏠 В главное меню", callback_data="back_main")
-                    ]]),
+            await asyncio.gather(
+                callback.message.edit_text(
+                    f"✅ <b>Оплата подтверждена!</b>\n\n🎮 Запускаю игру...",
                     parse_mode="HTML"
-                )
-                await callback.answer("Ошибка", show_alert=True)
-                return
-            
-            await session.commit()
-
-            await callback.message.edit_text(
-                f"✅ <b>Оплата подтверждена!</b>\n\n🎮 Запускаю игру...",
-                parse_mode="HTML"
+                ),
+                callback.answer("Оплата подтверждена!"),
+                state.clear(),
             )
-            await callback.answer("Оплата подтверждена!")
-            await sleep(1)
-            
-            # Импорты игр
-            from game.dice import DiceGame
-            from game.darts import DartsGame
-            from game.basketball import BasketballGame
-            from game.bowling import BowlingGame
-            
-            # Определяем игру
-            if game_type.startswith("dice"):
-                game_instance = DiceGame(bot_instance, game, session)
-            elif game_type.startswith("darts"):
-                game_instance = DartsGame(bot_instance, game, session)
-            elif game_type.startswith("basketball"):
-                game_instance = BasketballGame(bot_instance, game, session)
-            elif game_type.startswith("football"):
-                game_instance = FootballGame(bot_instance, game, session)
-            elif game_type.startswith("bowling"):
-                game_instance = BowlingGame(bot_instance, game, session)
-            else:
-                logger.error(f"Неизвестный тип игры: {game_type}")
-                await callback.message.edit_text("Ошибка: неизвестный тип игры.", parse_mode="HTML")
-                return
-            
-            # ЗАПУСКАЕМ ИГРУ
-            await game_instance.play(callback.message.chat.id)
-            await state.clear()
+
+            # ЗАПУСКАЕМ ИГРУ — через ту же очередь, что и webhook: идемпотентно по invoice_id,
+            # поэтому параллельный webhook не сыграет ту же ставку второй раз
+            try:
+                payment_queue.submit(process_payment, invoice_data)
+            except QueueFullError as e:
+                # Счёт остаётся PENDING — игру запустит фоновая сверка
+                logger.warning(f"{e} — счёт {invoice_id} будет обработан сверкой")
 
         except Exception as e:
             logger.error(f"Ошибка: {e}", exc_info=True)
@@ -489,6 +454,68 @@ async def cmd_start(message: Message, state: FSMContext):
         parse_mode="HTML"
     )
 
+def is_admin(user_id: int) -> bool:
+    return bool(settings.admin_id) and str(user_id) == str(settings.admin_id)
+
+
+@router.message(Command("broadcast"))
+async def cmd_broadcast(message: Message, command: CommandObject):
+    """Рассылка всем пользователям: /broadcast <текст> (только администратор)"""
+    if not is_admin(message.from_user.id):
+        return
+    if not command.args:
+        await message.answer("Использование: /broadcast <текст>\n/broadcast_resume, /broadcast_cancel, /broadcast_status")
+        return
+    try:
+        broadcast_id = await broadcaster.start_new(command.args)
+    except RuntimeError as e:
+        await message.answer(f"❌ {e}")
+        return
+    await message.answer(f"📣 Рассылка #{broadcast_id} запущена")
+
+
+@router.message(Command("broadcast_resume"))
+async def cmd_broadcast_resume(message: Message):
+    """Продолжить прерванную рассылку с чекпоинта"""
+    if not is_admin(message.from_user.id):
+        return
+    try:
+        broadcast_id = await broadcaster.resume()
+    except RuntimeError as e:
+        await message.answer(f"❌ {e}")
+        return
+    if broadcast_id is None:
+        await message.answer("Незавершённых рассылок нет")
+    else:
+        await message.answer(f"📣 Рассылка #{broadcast_id} продолжена")
+
+
+@router.message(Command("broadcast_cancel"))
+async def cmd_broadcast_cancel(message: Message):
+    """Остановить текущую рассылку"""
+    if not is_admin(message.from_user.id):
+        return
+    if broadcaster.cancel():
+        await message.answer("Рассылка будет остановлена после текущей пачки")
+    else:
+        await message.answer("Рассылка не запущена")
+
+
+@router.message(Command("broadcast_status"))
+async def cmd_broadcast_status(message: Message):
+    """Прогресс текущей (последней) рассылки"""
+    if not is_admin(message.from_user.id):
+        return
+    stats = broadcaster.stats()
+    if stats["broadcast_id"] is None:
+        await message.answer("Рассылок ещё не было")
+        return
+    await message.answer(
+        f"📣 Рассылка #{stats['broadcast_id']} — {'идёт' if stats['running'] else 'остановлена'}\n"
+        f"Доставлено: {stats['sent']}, не доставлено: {stats['failed']}\n"
+        f"Скорость: {stats['per_sec']} сообщ./с"
+    )
+
 @router.message(F.text == "🎰 Играть")
 async def show_games(message: Message, state: FSMContext):
     """Показать список доступных игр"""
@@ -511,7 +538,9 @@ async def show_stats(message: Message):
         )
         username = user.username or "Без имени"
 
-        total_games = user.games_played
+        # Общее число игр — из счётчика пользователя (агрегаты по играм заполняются с момента их появления)
+        user_stats = await UserCRUD.get_stats(session, user.id)
+        total_games = user_stats["games_played"]
 
         game_names = {
             'dice_high': '🎲 Кости (Больше)',
@@ -525,41 +554,19 @@ async def show_stats(message: Message):
             'bowling': '🎳 Боулинг'
         }
 
-        favorite_game_query = await session.execute(
-            text("""
-                SELECT game_type, COUNT(*) as count 
-                FROM games 
-                WHERE user_id = :user_id AND status = 'COMPLETED' 
-                GROUP BY game_type 
-                ORDER BY count DESC 
-                LIMIT 1
-            """),
-            {"user_id": user.id}
-        )
-        favorite_game_result = favorite_game_query.fetchone()
-        
-        if favorite_game_result:
-            favorite_game_type = favorite_game_result[0]
-            favorite_game = game_names.get(favorite_game_type, favorite_game_type)
-            favorite_game_count = favorite_game_result[1]
+        # Агрегаты по типам игр: несколько строк по первичному ключу вместо GROUP BY по всей истории
+        game_stats = await GameStatsCRUD.get_user_stats(session, user.id)
+
+        if game_stats:
+            favorite = game_stats[0]
+            favorite_game = game_names.get(favorite.game_type, favorite.game_type)
+            favorite_game_count = favorite.games_count
         else:
             favorite_game = "Не определена"
             favorite_game_count = 0
 
-  ## Максимальная выплата
-        max_win_query = await session.execute(
-            text("""
-                SELECT COALESCE(MAX(payout), 0) 
-                FROM games 
-                WHERE user_id = :user_id 
-                AND payout IS NOT NULL
-                AND status != 'PENDING'
-            """),
-            {"user_id": user.id}
-        )
-        max_win = max_win_query.scalar() or 0.0
-        
-        
+        # Максимальная выплата
+        max_win = max((row.max_payout for row in game_stats), default=0.0)
 
         stats_message = (
             f"🗂 Информация по пользователю <b>{username}</b>\n\n"
@@ -3,6 +3,10 @@
 
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
+# Стандартные суммы ставок и валюты оплаты (используются и пулом счетов)
+BET_AMOUNTS = [1, 3, 5, 10, 25, 50]
+BET_CURRENCIES = ["USDT", "TON", "BTC", "ETH", "LTC", "TRX"]
+
 # ==================== ГЛАВНОЕ МЕНЮ ====================
 
 def get_main_menu():
@@ -133,17 +137,13 @@ def get_amount_keyboard(game_type: str = ""):
     Быстрые кнопки для выбора суммы.
     game_type используется для правильной навигации назад
     """
+    amount_buttons = [
+        InlineKeyboardButton(text=f"{amount} USDT", callback_data=f"amount_{amount}")
+        for amount in BET_AMOUNTS
+    ]
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="1 USDT", callback_data="amount_1"),
-            InlineKeyboardButton(text="3 USDT", callback_data="amount_3"),
-            InlineKeyboardButton(text="5 USDT", callback_data="amount_5")
-        ],
-        [
-            InlineKeyboardButton(text="10 USDT", callback_data="amount_10"),
-            InlineKeyboardButton(text="25 USDT", callback_data="amount_25"),
-            InlineKeyboardButton(text="50 USDT", callback_data="amount_50")
-        ],
+        amount_buttons[:3],
+        amount_buttons[3:],
         [InlineKeyboardButton(text="✍️ Своя сумма", callback_data="amount_custom")],
         [InlineKeyboardButton(text="◀️ Назад", callback_data=f"back_to_bet_{game_type}")]
     ])
@@ -156,17 +156,13 @@ def get_currency_keyboard(game_type: str = ""):
     Выбор валюты для оплаты.
     game_type используется для правильной навигации назад
     """
+    currency_buttons = [
+        InlineKeyboardButton(text=currency, callback_data=f"currency_{currency}")
+        for currency in BET_CURRENCIES
+    ]
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="USDT", callback_data="currency_USDT"),
-            InlineKeyboardButton(text="TON", callback_data="currency_TON"),
-            InlineKeyboardButton(text="BTC", callback_data="currency_BTC")
-        ],
-        [
-            InlineKeyboardButton(text="ETH", callback_data="currency_ETH"),
-            InlineKeyboardButton(text="LTC", callback_data="currency_LTC"),
-            InlineKeyboardButton(text="TRX", callback_data="currency_TRX")
-        ],
+        currency_buttons[:3],
+        currency_buttons[3:],
         [InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_amount")]
     ])
     return keyboard
\ No newline at end of file
@@ -0,0 +1,64 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram import Bot
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BotMetadata:
+    """Сведения о боте из getMe"""
+    id: int
+    username: Optional[str]
+    first_name: str
+    can_join_groups: bool = False
+    can_read_all_group_messages: bool = False
+    supports_inline_queries: bool = False
+
+
+class BotMetadataCache:
+    """
+    Кэш сведений о боте: заполняется один раз в lifespan и
+    обновляется только по явному запросу (refresh).
+    """
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        self.metadata: Optional[BotMetadata] = None
+
+    async def load(self, bot: Bot) -> BotMetadata:
+        """Запросить getMe и сохранить результат"""
+        self._bot = bot
+        return await self.refresh()
+
+    async def refresh(self) -> BotMetadata:
+        """Принудительно обновить сведения (например, после смены username)"""
+        if self._bot is None:
+            raise RuntimeError("Бот не передан в кэш метаданных")
+        me = await self._bot.get_me()
+        self.metadata = BotMetadata(
+            id=me.id,
+            username=me.username,
+            first_name=me.first_name,
+            can_join_groups=bool(me.can_join_groups),
+            can_read_all_group_messages=bool(me.can_read_all_group_messages),
+            supports_inline_queries=bool(me.supports_inline_queries),
+        )
+        logger.info(f"Метаданные бота загружены: @{self.metadata.username} (id={self.metadata.id})")
+        return self.metadata
+
+    @property
+    def username(self) -> Optional[str]:
+        return self.metadata.username if self.metadata else None
+
+    @property
+    def return_url(self) -> Optional[str]:
+        """Ссылка для кнопки возврата в бота после оплаты"""
+        return f"https://t.me/{self.username}" if self.username else None
+
+
+# Глобальный кэш метаданных бота
+bot_metadata = BotMetadataCache()
@@ -0,0 +1,265 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from config import settings
+from utils.lru import LRUCache
+from utils.rate_limit import TokenBucket
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов (меньше — раньше)
+PRIORITY_RESULT = 0  # результат игры, выплата
+PRIORITY_DEFAULT = 1  # обычные сообщения
+PRIORITY_MENU = 2  # редактирование меню, удаление сообщений
+PRIORITY_BROADCAST = 3  # рассылки администратора
+
+# Методы, на которые распространяются лимиты Telegram на отправку сообщений
+RATE_LIMITED_METHODS = {
+    "SendMessage": PRIORITY_DEFAULT,
+    "SendDice": PRIORITY_DEFAULT,
+    "SendPhoto": PRIORITY_DEFAULT,
+    "SendDocument": PRIORITY_DEFAULT,
+    "SendSticker": PRIORITY_DEFAULT,
+    "CopyMessage": PRIORITY_DEFAULT,
+    "ForwardMessage": PRIORITY_DEFAULT,
+    "EditMessageText": PRIORITY_MENU,
+    "EditMessageReplyMarkup": PRIORITY_MENU,
+    "DeleteMessage": PRIORITY_MENU,
+}
+
+_priority: ContextVar[Optional[int]] = ContextVar("outbound_priority", default=None)
+
+
+@contextmanager
+def outbound_priority(priority: int):
+    """Задать приоритет для всех запросов к Bot API внутри блока (и порождённых задач)"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Request:
+    __slots__ = ("priority", "seq", "enqueued_at", "chat_id", "make_request", "bot", "method", "future", "attempts")
+
+    def __init__(self, priority, seq, chat_id, make_request, bot, method, future):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.chat_id = chat_id
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.future = future
+        self.attempts = 0
+
+    def sort_key(self) -> Tuple[int, int]:
+        return self.priority, self.seq
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Bot API (middleware сессии бота).
+
+    - отправки сообщений, редактирования и удаления встают в очередь с приоритетом:
+      результаты игр раньше правок меню;
+    - общий token bucket держит глобальный лимит (~30 сообщений/с),
+      по чату — свой bucket (личные чаты ~1/с, группы ~20/мин);
+      чат без свободного токена не блокирует очередь для остальных чатов;
+    - TelegramRetryAfter ставит на паузу весь планировщик на retry_after
+      и возвращает запрос в очередь;
+    - остальные методы (answerCallbackQuery, getMe, setWebhook...) идут напрямую.
+    """
+
+    def __init__(self,
+                 global_rate: float = 30.0,
+                 chat_rate: float = 1.0,
+                 chat_burst: int = 3,
+                 group_rate: float = 20 / 60,
+                 group_burst: int = 3,
+                 max_retries: int = 3):
+        self.global_limiter = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+
+        self._chat_limiters = LRUCache(maxsize=50000, ttl=60.0)
+        self._heap: List[Tuple[Tuple[int, int], _Request]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.retry_after_pauses = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.max_depth_seen = 0
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType,
+                       bot: Bot,
+                       method: TelegramMethod) -> Any:
+        default_priority = RATE_LIMITED_METHODS.get(type(method).__name__)
+        if default_priority is None or self._task is None:
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        request = _Request(
+            priority=default_priority if priority is None else priority,
+            seq=next(self._seq),
+            chat_id=getattr(method, "chat_id", None),
+            make_request=make_request,
+            bot=bot,
+            method=method,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._push(request)
+        return await request.future
+
+    def _push(self, request: _Request) -> None:
+        heapq.heappush(self._heap, (request.sort_key(), request))
+        self.max_depth_seen = max(self.max_depth_seen, len(self._heap))
+        self._wakeup.set()
+
+    def _chat_limiter(self, chat_id) -> Optional[TokenBucket]:
+        if chat_id is None:
+            return None
+        limiter = self._chat_limiters.get(chat_id)
+        if limiter is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            limiter = (TokenBucket(self.group_rate, self.group_burst) if is_group
+                       else TokenBucket(self.chat_rate, self.chat_burst))
+            self._chat_limiters.set(chat_id, limiter)
+        return limiter
+
+    async def _run(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+
+            # Берём первый по приоритету запрос, чат которого не упёрся в лимит
+            deferred = []
+            request = None
+            while self._heap:
+                _, candidate = heapq.heappop(self._heap)
+                limiter = self._chat_limiter(candidate.chat_id)
+                if limiter is None or limiter.try_acquire():
+                    request = candidate
+                    break
+                deferred.append(candidate)
+            for candidate in deferred:
+                heapq.heappush(self._heap, (candidate.sort_key(), candidate))
+
+            if request is None:
+                # Все ожидающие чаты исчерпали свои лимиты
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=0.05)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.global_limiter.acquire()
+            waited = time.monotonic() - request.enqueued_at
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+            task = asyncio.create_task(self._execute(request))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, request: _Request) -> None:
+        request.attempts += 1
+        try:
+            result = await request.make_request(request.bot, request.method)
+        except TelegramRetryAfter as e:
+            self.retry_after_pauses += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            logger.warning(f"Telegram RetryAfter {e.retry_after}s: исходящие запросы на паузе")
+            if request.attempts <= self.max_retries:
+                self._push(request)
+                return
+            self.failed += 1
+            if not request.future.done():
+                request.future.set_exception(e)
+        except Exception as e:
+            self.failed += 1
+            if not request.future.done():
+                request.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def stats(self) -> dict:
+        dispatched = self.sent + self.failed
+        return {
+            "depth": len(self._heap),
+            "max_depth_seen": self.max_depth_seen,
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retry_after_pauses": self.retry_after_pauses,
+            "paused": self._paused_until > time.monotonic(),
+            "wait_avg_ms": round(self.wait_time_total / dispatched * 1000, 1) if dispatched else 0.0,
+            "wait_max_ms": round(self.wait_time_max * 1000, 1),
+        }
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Планировщик исходящих сообщений Telegram запущен")
+
+    async def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Дождаться отправки очереди (не дольше timeout), затем остановиться"""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while (self._heap or self._in_flight) and (deadline is None or time.monotonic() < deadline):
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        for _, request in self._heap:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("Планировщик исходящих сообщений остановлен"))
+        if self._heap:
+            logger.warning(f"Планировщик остановлен, не отправлено запросов: {len(self._heap)}")
+        self._heap = []
+
+
+# Глобальный планировщик исходящих запросов
+outbound_scheduler = OutboundScheduler(
+    global_rate=settings.TELEGRAM_GLOBAL_RATE,
+    chat_rate=settings.TELEGRAM_CHAT_RATE,
+    chat_burst=settings.TELEGRAM_CHAT_BURST,
+    group_rate=settings.TELEGRAM_GROUP_RATE,
+    max_retries=settings.TELEGRAM_RETRY_AFTER_MAX_RETRIES,
+)
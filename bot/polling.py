@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+import aiohttp
+from aiogram import Bot
+
+from bot.update_dispatcher import update_dispatcher
+from config import settings
+from payment.resilience import backoff_delay
+from utils.http_client import http_client
+from utils.work_queue import QueueFullError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class UpdatePoller:
+    """
+    Приём обновлений Telegram через long polling (альтернатива webhook).
+
+    getUpdates запрашивается большими пачками (limit/timeout) напрямую через
+    общий HTTP-клиент — без разбора в модели aiogram, сырые dict сразу уходят
+    в update_dispatcher, как и из webhook. Если шард переполнен, поллер ждёт
+    (backpressure), а не теряет обновления. Offset после каждой пачки
+    сохраняется в файл, чтобы после рестарта не обрабатывать пачку повторно.
+    """
+
+    def __init__(self,
+                 limit: int = 100,
+                 timeout: int = 25,
+                 offset_file: Optional[str] = None,
+                 allowed_updates: Optional[List[str]] = None):
+        self.limit = limit
+        self.timeout = timeout
+        self.offset_file = offset_file
+        self.allowed_updates = allowed_updates
+
+        self.offset: Optional[int] = None
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Счётчики для мониторинга
+        self.polls = 0
+        self.updates = 0
+        self.errors = 0
+        self.backpressure_waits = 0
+        self.last_batch = 0
+        self.max_batch = 0
+        self.started_at: Optional[float] = None
+
+    def set_bot(self, bot: Bot) -> None:
+        self._bot = bot
+
+    def _load_offset(self) -> Optional[int]:
+        if not self.offset_file or not os.path.exists(self.offset_file):
+            return None
+        try:
+            with open(self.offset_file) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать offset из {self.offset_file}: {e}")
+            return None
+
+    def _save_offset(self) -> None:
+        if not self.offset_file or self.offset is None:
+            return
+        tmp_path = f"{self.offset_file}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(str(self.offset))
+            os.replace(tmp_path, self.offset_file)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить offset в {self.offset_file}: {e}")
+
+    async def _get_updates(self) -> List[dict]:
+        url = self._bot.session.api.api_url(token=self._bot.token, method="getUpdates")
+        payload = {"limit": self.limit, "timeout": self.timeout}
+        if self.offset is not None:
+            payload["offset"] = self.offset
+        if self.allowed_updates is not None:
+            payload["allowed_updates"] = self.allowed_updates
+
+        # Long polling держит соединение timeout секунд — общий таймаут клиента не подходит
+        request_timeout = aiohttp.ClientTimeout(total=self.timeout + 10)
+        async with http_client.session.post(url, json=payload, timeout=request_timeout) as response:
+            data = await response.json(content_type=None)
+        if not data.get("ok"):
+            raise RuntimeError(f"getUpdates: {data.get('error_code')} {data.get('description')}")
+        return data["result"]
+
+    async def _submit(self, update: dict) -> None:
+        while True:
+            try:
+                update_dispatcher.submit(update)
+                return
+            except QueueFullError:
+                self.backpressure_waits += 1
+                await asyncio.sleep(0.05)
+
+    async def _run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                batch = await self._get_updates()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                failures += 1
+                delay = backoff_delay(failures, base=0.5, cap=10.0)
+                logger.warning(f"Ошибка getUpdates, повтор через {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            failures = 0
+            self.polls += 1
+            self.last_batch = len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+            if not batch:
+                continue
+
+            for update in batch:
+                await self._submit(update)
+                self.offset = update["update_id"] + 1
+            self.updates += len(batch)
+            self._save_offset()
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "running": self._task is not None,
+            "offset": self.offset,
+            "polls": self.polls,
+            "updates": self.updates,
+            "updates_per_sec": round(self.updates / elapsed, 1) if elapsed else 0.0,
+            "last_batch": self.last_batch,
+            "max_batch": self.max_batch,
+            "backpressure_waits": self.backpressure_waits,
+            "errors": self.errors,
+        }
+
+    async def start(self) -> None:
+        if self._bot is None:
+            raise RuntimeError("bot не инициализирован")
+        if self._task is None:
+            self.offset = self._load_offset()
+            self.started_at = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Long polling запущен: limit={self.limit}, timeout={self.timeout}s, offset={self.offset}")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._save_offset()
+
+
+# Глобальный поллер обновлений
+update_poller = UpdatePoller(
+    limit=settings.POLLING_LIMIT,
+    timeout=settings.POLLING_TIMEOUT,
+    offset_file=settings.POLLING_OFFSET_FILE,
+)
@@ -0,0 +1,121 @@
+import json
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder
+from aiogram.types import TelegramObject
+
+from config import settings
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Кэш state/data на время обработки одного апдейта (None — вне апдейта)
+_update_cache: ContextVar[Optional[Dict[Tuple[str, StorageKey], Any]]] = ContextVar("fsm_update_cache", default=None)
+
+
+def compact_json_dumps(data: Any) -> str:
+    """Компактная сериализация состояния: без пробелов и \\u-экранирования"""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+class FSMUpdateScopeMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: открывает кэш FSM на время обработки одного апдейта"""
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        token = _update_cache.set({})
+        try:
+            return await handler(event, data)
+        finally:
+            _update_cache.reset(token)
+
+
+class CachedRedisStorage(RedisStorage):
+    """
+    FSM-хранилище в Redis с кэшем на время одного апдейта.
+
+    - состояние BetFlow переживает рестарт и доступно всем процессам;
+    - state/data хранятся с TTL, брошенные сценарии удаляются сами;
+    - чтения повторяются по несколько раз за один апдейт (фильтры, хендлер),
+      поэтому внутри FSMUpdateScopeMiddleware state/data читаются из Redis один раз,
+      запись — write-through. Между апдейтами кэша нет: другой процесс мог
+      изменить состояние, и каждый апдейт начинает с актуального значения из Redis.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Счётчики для мониторинга
+        self.hits = 0
+        self.misses = 0
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await super().set_state(key, state)
+        scope = _update_cache.get()
+        if scope is not None:
+            scope[("state", key)] = state.state if isinstance(state, State) else state
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        scope = _update_cache.get()
+        if scope is not None and ("state", key) in scope:
+            self.hits += 1
+            return scope[("state", key)]
+        self.misses += 1
+        state = await super().get_state(key)
+        if scope is not None:
+            scope[("state", key)] = state
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await super().set_data(key, data)
+        scope = _update_cache.get()
+        if scope is not None:
+            scope[("data", key)] = dict(data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        scope = _update_cache.get()
+        if scope is not None and ("data", key) in scope:
+            self.hits += 1
+            return dict(scope[("data", key)])
+        self.misses += 1
+        data = await super().get_data(key)
+        if scope is not None:
+            scope[("data", key)] = dict(data)
+        return data
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Хранилище FSM по настройкам:
+    REDIS_URL не задан — MemoryStorage; "fakeredis://" — fakeredis (тесты); иначе Redis.
+    """
+    if not settings.REDIS_URL:
+        return MemoryStorage()
+
+    storage_kwargs = dict(
+        key_builder=DefaultKeyBuilder(prefix=settings.FSM_KEY_PREFIX),
+        state_ttl=settings.FSM_STATE_TTL,
+        data_ttl=settings.FSM_DATA_TTL,
+        json_dumps=compact_json_dumps,
+    )
+
+    if settings.REDIS_URL.startswith("fakeredis://"):
+        try:
+            from fakeredis.aioredis import FakeRedis
+        except ImportError:
+            raise RuntimeError("Для REDIS_URL=fakeredis:// установите пакет fakeredis")
+        logger.info("FSM: используется fakeredis")
+        return CachedRedisStorage(redis=FakeRedis(), **storage_kwargs)
+
+    logger.info("FSM: используется Redis")
+    return CachedRedisStorage.from_url(settings.REDIS_URL, **storage_kwargs)
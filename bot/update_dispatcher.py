@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+
+from config import settings
+from utils.work_queue import WorkQueue, QueueFullError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Типы обновлений, в которых есть отправитель (from)
+_USER_UPDATE_TYPES = (
+    "message", "edited_message", "callback_query", "inline_query",
+    "chosen_inline_result", "shipping_query", "pre_checkout_query", "my_chat_member",
+)
+
+
+def get_update_user_id(update: dict) -> Optional[int]:
+    """Найти id пользователя в сыром update Telegram"""
+    for update_type in _USER_UPDATE_TYPES:
+        event = update.get(update_type)
+        if event:
+            sender = event.get("from") or {}
+            return sender.get("id")
+    return None
+
+
+class UpdateDispatcher:
+    """
+    Шардированная обработка обновлений Telegram.
+
+    Каждое обновление попадает в шард по from_user.id: внутри шарда один воркер,
+    поэтому обновления одного пользователя обрабатываются строго по порядку,
+    а разные пользователи — параллельно в разных шардах. Webhook отвечает
+    Telegram сразу после постановки в очередь.
+    """
+
+    def __init__(self, shards: int = 16, shard_max_depth: int = 500):
+        self.shards: List[WorkQueue] = [
+            WorkQueue(f"updates-{i}", workers=1, max_depth=shard_max_depth) for i in range(shards)
+        ]
+        self._bot: Optional[Bot] = None
+        self._dp: Optional[Dispatcher] = None
+
+    def set_target(self, bot: Bot, dp: Dispatcher) -> None:
+        self._bot = bot
+        self._dp = dp
+
+    def shard_for(self, update: dict) -> WorkQueue:
+        user_id = get_update_user_id(update)
+        key = user_id if user_id is not None else update.get("update_id", 0)
+        return self.shards[key % len(self.shards)]
+
+    def submit(self, update: dict) -> None:
+        """Поставить обновление в шард пользователя; при переполнении — QueueFullError"""
+        if self._bot is None or self._dp is None:
+            raise RuntimeError("bot или dp не инициализированы")
+        self.shard_for(update).submit(self._feed, update)
+
+    async def _feed(self, update: dict) -> None:
+        await self._dp.feed_raw_update(self._bot, update)
+
+    def stats(self) -> dict:
+        shard_stats = [shard.stats() for shard in self.shards]
+        return {
+            "shards": len(self.shards),
+            "depth": sum(s["depth"] for s in shard_stats),
+            "processed": sum(s["processed"] for s in shard_stats),
+            "rejected": sum(s["rejected"] for s in shard_stats),
+            "wait_max_ms": max((s["wait_max_ms"] for s in shard_stats), default=0.0),
+            "per_shard": shard_stats,
+        }
+
+    async def start(self) -> None:
+        for shard in self.shards:
+            await shard.start()
+
+    async def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Шарды дренируются параллельно: остановка занимает не больше timeout, а не shards × timeout"""
+        await asyncio.gather(*(shard.stop(timeout=timeout) for shard in self.shards))
+
+
+# Глобальный диспетчер обновлений
+update_dispatcher = UpdateDispatcher(
+    shards=settings.UPDATE_SHARDS,
+    shard_max_depth=settings.UPDATE_SHARD_MAX_DEPTH,
+)
@@ -1,16 +1,16 @@
 import asyncio
-import aiohttp
 from config import settings
+from utils.http_client import http_client
 
 async def check_cryptobot_webhook():
-    url = "https://pay.crypt.bot/api/getWebhookInfo"
+    url = f"{settings.CRYPTOBOT_API_URL}/getWebhookInfo"
     headers = {
         "Crypto-Pay-API-Token": settings.cryptobot_token,
         "Content-Type": "application/json"
     }
     
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
+    try:
+        async with http_client.session.get(url, headers=headers) as resp:
             result = await resp.json()
             print("="*60)
             print("ПРОВЕРКА CRYPTOBOT WEBHOOK")
@@ -21,6 +21,8 @@ async def check_cryptobot_webhook():
             else:
                 print(f"Ошибка: {result}")
             print("="*60)
+    finally:
+        await http_client.close()
 
 if __name__ == "__main__":
     asyncio.run(check_cryptobot_webhook())
@@ -0,0 +1,21 @@
+"""
+Скрипт для заполнения user_game_stats по уже сыгранным играм
+Запускать один раз после обновления (при остановленном боте): python -m database.backfill_game_stats
+"""
+
+import asyncio
+from database.database import async_session_maker, init_db
+from database.crud import GameStatsCRUD
+
+
+async def backfill_game_stats():
+    """Пересчитывает агрегаты статистики по таблице games"""
+    await init_db()
+    async with async_session_maker() as session:
+        rows = await GameStatsCRUD.backfill(session)
+    
+    print(f"✅ user_game_stats заполнена: {rows} строк")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_game_stats())
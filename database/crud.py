@@ -1,49 +1,105 @@
-from sqlalchemy import select, update
+from dataclasses import dataclass
+from sqlalchemy import bindparam, case, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import User, Game, Transaction, GameStatus, GameResult, TransactionStatus
-from datetime import datetime
-from typing import Optional, Union, List
+from database.models import (
+    User, Game, Transaction, PayoutOutbox, Broadcast, BroadcastFailure, UserGameStats,
+    GameStatus, GameResult, TransactionStatus, OutboxStatus, BroadcastStatus,
+)
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional, Union, List, Tuple
 import logging
 
+from config import settings
+from utils.lru import LRUCache
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Горячие запросы строятся один раз: текст SQL не меняется, поэтому компиляция
+# берётся из кэша SQLAlchemy, а asyncpg выполняет готовый prepared statement соединения
+USER_BY_TELEGRAM_ID = select(User).where(User.telegram_id == bindparam("telegram_id"))
+GAME_BY_GAME_ID = select(Game).where(Game.game_id == bindparam("game_id"))
+TRANSACTION_BY_INVOICE_ID = select(Transaction).where(Transaction.invoice_id == bindparam("invoice_id"))
+
+# Для прогрева пула: запросы с заведомо пустым результатом
+HOT_LOOKUPS = [
+    (USER_BY_TELEGRAM_ID, {"telegram_id": 0}),
+    (GAME_BY_GAME_ID, {"game_id": ""}),
+    (TRANSACTION_BY_INVOICE_ID, {"invoice_id": ""}),
+]
+
+
+@dataclass(frozen=True)
+class UserRef:
+    """Неизменяемые данные пользователя, которые можно кэшировать (без статистики)"""
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+
+
+# telegram_id -> UserRef: повторные визиты не ходят в БД
+user_cache = LRUCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+
 class UserCRUD:
     """Класс для работы с моделью User"""
 
     @staticmethod
-    async def get_or_create(session: AsyncSession, telegram_id: int, username: str = None, first_name: str = None) -> User:
-        """Получить или создать пользователя по telegram_id"""
+    async def get_or_create(session: AsyncSession, telegram_id: int, username: str = None, first_name: str = None,
+                            commit: bool = True) -> UserRef:
+        """
+        Получить или создать пользователя по telegram_id.
+
+        Сначала смотрим в кэш: если профиль не изменился — запросов к БД нет.
+        Иначе один INSERT ... ON CONFLICT (telegram_id) DO UPDATE ... RETURNING:
+        создаёт пользователя или обновляет username/first_name без гонки на уникальном ключе.
+        commit=False — выполнить в транзакции вызывающего кода.
+        """
+        username = username or f"user_{telegram_id}"
+        cached = user_cache.get(telegram_id)
+        if cached is not None and cached.username == username and cached.first_name == first_name:
+            return cached
+
         try:
+            insert_stmt = pg_insert(User).values(
+                telegram_id=telegram_id,
+                username=username,
+                first_name=first_name,
+            )
             result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
+                insert_stmt.on_conflict_do_update(
+                    index_elements=[User.telegram_id],
+                    set_={
+                        "username": insert_stmt.excluded.username,
+                        "first_name": insert_stmt.excluded.first_name,
+                        "last_activity": datetime.utcnow(),
+                    },
+                ).returning(User.id, literal_column("(xmax = 0)").label("inserted"))
             )
-            user = result.scalar_one_or_none()
-
-            if user is None:
-                user = User(
-                    telegram_id=telegram_id,
-                    username=username or f"user_{telegram_id}",
-                    first_name=first_name,
-                )
-                session.add(user)
+            user_id, inserted = result.one()
+            if commit:
                 await session.commit()
-                await session.refresh(user)
-                logger.info(f"Создан новый пользователь: telegram_id={telegram_id}, username={username}")
-            else:
-                logger.debug(f"Найден существующий пользователь: telegram_id={telegram_id}")
-            return user
         except Exception as e:
             logger.error(f"Ошибка при создании/получении пользователя: {e}")
+            if commit:
+                await session.rollback()
             raise
 
+        user = UserRef(id=user_id, telegram_id=telegram_id, username=username, first_name=first_name)
+        # Новую строку без коммита не кэшируем: транзакция вызывающего кода ещё может откатиться
+        if commit or not inserted:
+            user_cache.set(telegram_id, user)
+        if inserted:
+            logger.info(f"Создан новый пользователь: telegram_id={telegram_id}, username={username}")
+        return user
+
     @staticmethod
     async def get_by_telegram_id(session: AsyncSession, telegram_id: int) -> Optional[User]:
         """Получить пользователя по telegram_id"""
         try:
-            result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
+            result = await session.execute(USER_BY_TELEGRAM_ID, {"telegram_id": telegram_id})
             user = result.scalar_one_or_none()
             logger.debug(f"Поиск пользователя по telegram_id={telegram_id}: {'Найден' if user else 'Не найден'}")
             return user
@@ -52,18 +108,38 @@ class UserCRUD:
             raise
 
     @staticmethod
-    async def update_stats(session: AsyncSession, user: User, wagered: float = 0.0, won: float = 0.0, games: int = 0) -> None:
-        """Обновить статистику пользователя"""
+    async def update_stats(session: AsyncSession, user_id: int, wagered: float = 0.0, won: float = 0.0,
+                           games: int = 0, commit: bool = True) -> Optional[Tuple[float, float, int]]:
+        """
+        Атомарно увеличить статистику пользователя одним UPDATE ... RETURNING:
+        без предварительной загрузки пользователя и без потерянных обновлений
+        при одновременном завершении нескольких игр.
+        commit=False — выполнить в транзакции вызывающего кода.
+        Возвращает (total_wagered, total_won, games_played) или None, если пользователя нет.
+        """
         try:
-            user.total_wagered += wagered
-            user.total_won += won
-            user.games_played += games
-            user.last_activity = datetime.utcnow()
-            await session.commit()
-            logger.info(f"Обновлена статистика пользователя {user.id}: wagered={user.total_wagered}, won={user.total_won}, games={user.games_played}")
+            result = await session.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(
+                    total_wagered=func.coalesce(User.total_wagered, 0.0) + wagered,
+                    total_won=func.coalesce(User.total_won, 0.0) + won,
+                    games_played=func.coalesce(User.games_played, 0) + games,
+                    last_activity=datetime.utcnow(),
+                )
+                .returning(User.total_wagered, User.total_won, User.games_played)
+                .execution_options(synchronize_session=False)
+            )
+            totals = result.one_or_none()
+            if commit:
+                await session.commit()
+            if totals is not None:
+                logger.info(f"Обновлена статистика пользователя {user_id}: wagered={totals[0]}, won={totals[1]}, games={totals[2]}")
+            return tuple(totals) if totals is not None else None
         except Exception as e:
-            logger.error(f"Ошибка при обновлении статистики пользователя {user.id}: {e}")
-            await session.rollback()
+            logger.error(f"Ошибка при обновлении статистики пользователя {user_id}: {e}")
+            if commit:
+                await session.rollback()
             raise
 
     @staticmethod
@@ -89,8 +165,11 @@ class GameCRUD:
 
     @staticmethod
     async def create(session: AsyncSession, game_id: str, user_id: int, game_type: str,
-                    bet_amount: float, currency: str = "USDT") -> Game:
-        """Создать новую игру"""
+                    bet_amount: float, currency: str = "USDT", commit: bool = True) -> Game:
+        """
+        Создать новую игру.
+        commit=False — только flush (game.id доступен), коммит делает вызывающий код.
+        """
         try:
             game = Game(
                 game_id=game_id,
@@ -102,22 +181,24 @@ class GameCRUD:
                 payout=0.0
             )
             session.add(game)
-            await session.commit()
-            await session.refresh(game)
+            if commit:
+                await session.commit()
+                await session.refresh(game)
+            else:
+                await session.flush()
             logger.info(f"Создана новая игра: game_id={game_id}, user_id={user_id}, type={game_type}")
             return game
         except Exception as e:
             logger.error(f"Ошибка при создании игры {game_id}: {e}")
-            await session.rollback()
+            if commit:
+                await session.rollback()
             raise
 
     @staticmethod
     async def get_by_game_id(session: AsyncSession, game_id: str) -> Optional[Game]:
         """Получить игру по game_id"""
         try:
-            result = await session.execute(
-                select(Game).where(Game.game_id == game_id)
-            )
+            result = await session.execute(GAME_BY_GAME_ID, {"game_id": game_id})
             game = result.scalar_one_or_none()
             logger.debug(f"Поиск игры по game_id={game_id}: {'Найдена' if game else 'Не найдена'}")
             return game
@@ -134,10 +215,14 @@ class GameCRUD:
             game.payout = payout
             game.completed_at = datetime.utcnow()
 
-            # Обновляем статистику пользователя
-            user = await session.get(User, game.user_id)
-            if user:
-                await UserCRUD.update_stats(session, user, wagered=game.bet_amount, won=payout if result == GameResult.WIN else 0.0, games=1)
+            # Статистика пользователя и агрегаты по типу игры — в той же транзакции
+            won = payout if result == GameResult.WIN else 0.0
+            await UserCRUD.update_stats(
+                session, game.user_id,
+                wagered=game.bet_amount, won=won, games=1,
+                commit=False
+            )
+            await GameStatsCRUD.record_game(session, game.user_id, game.game_type, game.bet_amount, won, payout)
 
             await session.commit()
             logger.info(f"Игра завершена: game_id={game.game_id}, result={result}, payout={payout}")
@@ -159,6 +244,89 @@ class GameCRUD:
             raise
 
 
+class GameStatsCRUD:
+    """Класс для работы с агрегатами user_game_stats"""
+
+    @staticmethod
+    async def record_game(session: AsyncSession, user_id: int, game_type: str,
+                          wagered: float, won: float, payout: float) -> None:
+        """Учесть завершённую игру (без коммита — вызывается из complete_game)"""
+        insert_stmt = pg_insert(UserGameStats).values(
+            user_id=user_id,
+            game_type=game_type,
+            games_count=1,
+            wagered=wagered or 0.0,
+            won=won or 0.0,
+            max_payout=payout or 0.0,
+        )
+        await session.execute(
+            insert_stmt.on_conflict_do_update(
+                index_elements=[UserGameStats.user_id, UserGameStats.game_type],
+                set_={
+                    "games_count": UserGameStats.games_count + 1,
+                    "wagered": UserGameStats.wagered + insert_stmt.excluded.wagered,
+                    "won": UserGameStats.won + insert_stmt.excluded.won,
+                    "max_payout": func.greatest(UserGameStats.max_payout, insert_stmt.excluded.max_payout),
+                },
+            )
+        )
+
+    @staticmethod
+    async def get_user_stats(session: AsyncSession, user_id: int) -> List[UserGameStats]:
+        """Агрегаты пользователя по типам игр, самые частые — первыми"""
+        try:
+            result = await session.execute(
+                select(UserGameStats)
+                .where(UserGameStats.user_id == user_id)
+                .order_by(UserGameStats.games_count.desc())
+            )
+            return list(result.scalars().all())
+        except Exception as e:
+            logger.error(f"Ошибка при получении агрегатов пользователя {user_id}: {e}")
+            raise
+
+    @staticmethod
+    async def backfill(session: AsyncSession) -> int:
+        """
+        Пересчитать user_game_stats по всем завершённым играм.
+        Повторный запуск перезаписывает агрегаты; запускать при остановленном боте,
+        иначе игры, завершённые во время пересчёта, могут не попасть в агрегаты.
+        """
+        try:
+            aggregates = (
+                select(
+                    Game.user_id,
+                    Game.game_type,
+                    func.count(),
+                    func.coalesce(func.sum(Game.bet_amount), 0.0),
+                    func.coalesce(func.sum(case((Game.result == GameResult.WIN, Game.payout), else_=0.0)), 0.0),
+                    func.coalesce(func.max(Game.payout), 0.0),
+                )
+                .where(Game.status == GameStatus.COMPLETED)
+                .group_by(Game.user_id, Game.game_type)
+            )
+            insert_stmt = pg_insert(UserGameStats).from_select(
+                ["user_id", "game_type", "games_count", "wagered", "won", "max_payout"], aggregates
+            )
+            result = await session.execute(
+                insert_stmt.on_conflict_do_update(
+                    index_elements=[UserGameStats.user_id, UserGameStats.game_type],
+                    set_={
+                        "games_count": insert_stmt.excluded.games_count,
+                        "wagered": insert_stmt.excluded.wagered,
+                        "won": insert_stmt.excluded.won,
+                        "max_payout": insert_stmt.excluded.max_payout,
+                    },
+                )
+            )
+            await session.commit()
+            return result.rowcount
+        except Exception as e:
+            logger.error(f"Ошибка при пересчёте user_game_stats: {e}")
+            await session.rollback()
+            raise
+
+
 class TransactionCRUD:
     """Класс для работы с моделью Transaction"""
 
@@ -170,19 +338,23 @@ class TransactionCRUD:
                      currency: str = "USDT",
                      status: Union[str, TransactionStatus] = TransactionStatus.PENDING,
                      game_id: Optional[str] = None,
-                     pay_url: Optional[str] = None) -> Transaction:
+                     pay_url: Optional[str] = None,
+                     game: Optional[Game] = None,
+                     commit: bool = True) -> Transaction:
         """
         Создать транзакцию.
         Поддерживает:
          - invoice_id как str/int (нормализуется в строку)
          - status как строку 'pending'/'paid'/'expired' или как TransactionStatus
          - необязательный pay_url
-         - game_id — UUID game.game_id (по нему ищется game.id)
+         - game — уже загруженная/созданная игра (без повторного запроса)
+         - game_id — UUID game.game_id (по нему ищется game.id), если game не передана
+         - commit=False — только flush, коммит делает вызывающий код
         """
         try:
             # Получаем game.id по game_id (UUID)
-            game_db_id = None
-            if game_id:
+            game_db_id = game.id if game is not None else None
+            if game_db_id is None and game_id:
                 game = await GameCRUD.get_by_game_id(session, game_id)
                 game_db_id = game.id if game else None
 
@@ -211,13 +383,17 @@ class TransactionCRUD:
                 pay_url=pay_url
             )
             session.add(transaction)
-            await session.commit()
-            await session.refresh(transaction)
+            if commit:
+                await session.commit()
+                await session.refresh(transaction)
+            else:
+                await session.flush()
             logger.info(f"Создана транзакция: invoice_id={invoice_id_str}, user_id={user_id}, status={status_enum}")
             return transaction
         except Exception as e:
             logger.error(f"Ошибка при создании транзакции {invoice_id}: {e}")
-            await session.rollback()
+            if commit:
+                await session.rollback()
             raise
 
     @staticmethod
@@ -225,9 +401,7 @@ class TransactionCRUD:
         """Получить транзакцию по invoice_id (нормализуем входной id в строку)"""
         try:
             invoice_id_str = str(invoice_id)
-            result = await session.execute(
-                select(Transaction).where(Transaction.invoice_id == invoice_id_str)
-            )
+            result = await session.execute(TRANSACTION_BY_INVOICE_ID, {"invoice_id": invoice_id_str})
             transaction = result.scalar_one_or_none()
             logger.debug(f"Поиск транзакции по invoice_id={invoice_id_str}: {'Найдена' if transaction else 'Не найдена'}")
             return transaction
@@ -264,6 +438,51 @@ class TransactionCRUD:
             await session.rollback()
             raise
 
+    @staticmethod
+    async def mark_paid_if_pending(session: AsyncSession, invoice_id: Union[str, int]) -> Optional[Transaction]:
+        """
+        Атомарно перевести транзакцию PENDING -> PAID.
+        Возвращает транзакцию, если переход выполнен этим вызовом, иначе None
+        (транзакции нет или её уже обработал другой обработчик).
+        """
+        try:
+            invoice_id_str = str(invoice_id)
+            result = await session.execute(
+                update(Transaction)
+                .where(Transaction.invoice_id == invoice_id_str)
+                .where(Transaction.status == TransactionStatus.PENDING)
+                .values(status=TransactionStatus.PAID, paid_at=datetime.utcnow())
+                .returning(Transaction)
+                .execution_options(synchronize_session=False)
+            )
+            transaction = result.scalar_one_or_none()
+            await session.commit()
+            if transaction:
+                logger.info(f"Транзакция {invoice_id_str} переведена в PAID")
+            return transaction
+        except Exception as e:
+            logger.error(f"Ошибка при подтверждении оплаты {invoice_id}: {e}")
+            await session.rollback()
+            raise
+
+    @staticmethod
+    async def get_pending_invoice_ids(session: AsyncSession, since: Optional[datetime] = None,
+                                      limit: int = 5000) -> List[str]:
+        """
+        Получить invoice_id транзакций в статусе PENDING (для сверки с CryptoBot).
+        Свежие счета идут первыми: при накоплении старых PENDING-записей сверх limit
+        новые платежи не вытесняются из выборки.
+        """
+        try:
+            query = select(Transaction.invoice_id).where(Transaction.status == TransactionStatus.PENDING)
+            if since is not None:
+                query = query.where(Transaction.created_at >= since)
+            result = await session.execute(query.order_by(Transaction.created_at.desc()).limit(limit))
+            return list(result.scalars().all())
+        except Exception as e:
+            logger.error(f"Ошибка при получении ожидающих транзакций: {e}")
+            raise
+
     @staticmethod
     async def get_user_transactions(session: AsyncSession, user_id: int) -> List[Transaction]:
         """Получить все транзакции пользователя"""
@@ -274,4 +493,228 @@ class TransactionCRUD:
             return result.scalars().all()
         except Exception as e:
             logger.error(f"Ошибка при получении транзакций пользователя {user_id}: {e}")
-            raise
\ No newline at end of file
+            raise
+
+
+class OutboxCRUD:
+    """Класс для работы с outbox выплат"""
+
+    @staticmethod
+    def add_payout(session: AsyncSession, game: Game, user_telegram_id: int, asset: str, amount: float) -> PayoutOutbox:
+        """
+        Добавить выплату в outbox БЕЗ коммита: запись фиксируется
+        тем же коммитом, что и завершение игры.
+        """
+        entry = PayoutOutbox(
+            game_id=game.id,
+            user_telegram_id=user_telegram_id,
+            asset=asset,
+            amount=amount,
+            status=OutboxStatus.PENDING,
+            attempts=0
+        )
+        session.add(entry)
+        return entry
+
+    @staticmethod
+    async def claim_batch(session: AsyncSession, limit: int, lease_seconds: float) -> List[PayoutOutbox]:
+        """
+        Захватить пачку выплат на обработку. Берутся PENDING-записи и PROCESSING-записи
+        с истёкшей арендой (процесс упал, не дойдя до createCheck). ISSUING-записи
+        не захватываются никогда: чек мог быть создан. SKIP LOCKED позволяет
+        нескольким процессам разбирать outbox параллельно.
+        """
+        try:
+            now = datetime.utcnow()
+            candidates = (
+                select(PayoutOutbox.id)
+                .where(
+                    (PayoutOutbox.status == OutboxStatus.PENDING)
+                    | ((PayoutOutbox.status == OutboxStatus.PROCESSING) & (PayoutOutbox.locked_until < now))
+                )
+                .order_by(PayoutOutbox.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            result = await session.execute(
+                update(PayoutOutbox)
+                .where(PayoutOutbox.id.in_(candidates))
+                .values(
+                    status=OutboxStatus.PROCESSING,
+                    locked_until=now + timedelta(seconds=lease_seconds),
+                    attempts=PayoutOutbox.attempts + 1
+                )
+                .returning(PayoutOutbox)
+                .execution_options(synchronize_session=False)
+            )
+            entries = list(result.scalars().all())
+            await session.commit()
+            return entries
+        except Exception as e:
+            logger.error(f"Ошибка при захвате выплат из outbox: {e}")
+            await session.rollback()
+            raise
+
+    @staticmethod
+    async def mark_issuing(session: AsyncSession, outbox_id: int, lease_seconds: float) -> bool:
+        """
+        Зафиксировать ISSUING перед запросом createCheck. После этого запись не
+        захватывается повторно. False — запись уже не наша (аренду перехватили).
+        """
+        try:
+            result = await session.execute(
+                update(PayoutOutbox)
+                .where(PayoutOutbox.id == outbox_id, PayoutOutbox.status == OutboxStatus.PROCESSING)
+                .values(
+                    status=OutboxStatus.ISSUING,
+                    locked_until=datetime.utcnow() + timedelta(seconds=lease_seconds)
+                )
+                .returning(PayoutOutbox.id)
+            )
+            issued = result.scalar_one_or_none() is not None
+            await session.commit()
+            return issued
+        except Exception as e:
+            logger.error(f"Ошибка при пометке выплаты {outbox_id} как ISSUING: {e}")
+            await session.rollback()
+            raise
+
+    @staticmethod
+    async def fail_stuck_issuing(session: AsyncSession) -> List[int]:
+        """
+        ISSUING-записи с истёкшей арендой (процесс упал после отправки createCheck
+        или ответ так и не пришёл) переводятся в FAILED на ручную сверку с CryptoBot.
+        """
+        try:
+            now = datetime.utcnow()
+            result = await session.execute(
+                update(PayoutOutbox)
+                .where(PayoutOutbox.status == OutboxStatus.ISSUING, PayoutOutbox.locked_until < now)
+                .values(
+                    status=OutboxStatus.FAILED,
+                    last_error="Завис в ISSUING: чек мог быть создан, требуется ручная сверка",
+                    processed_at=now,
+                    locked_until=None
+                )
+                .returning(PayoutOutbox.id)
+            )
+            ids = list(result.scalars().all())
+            await session.commit()
+            return ids
+        except Exception as e:
+            logger.error(f"Ошибка при разборе зависших выплат: {e}")
+            await session.rollback()
+            raise
+
+    @staticmethod
+    async def mark_done(session: AsyncSession, outbox_id: int, check_url: str) -> None:
+        """Отметить выплату выполненной"""
+        try:
+            await session.execute(
+                update(PayoutOutbox)
+                .where(PayoutOutbox.id == outbox_id)
+                .values(status=OutboxStatus.DONE, check_url=check_url, processed_at=datetime.utcnow(), locked_until=None)
+            )
+            await session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при завершении выплаты {outbox_id}: {e}")
+            await session.rollback()
+            raise
+
+    @staticmethod
+    async def mark_failed(session: AsyncSession, outbox_id: int, error: str) -> None:
+        """Отметить выплату неудавшейся (требует ручного разбора)"""
+        try:
+            await session.execute(
+                update(PayoutOutbox)
+                .where(PayoutOutbox.id == outbox_id)
+                .values(status=OutboxStatus.FAILED, last_error=error, processed_at=datetime.utcnow(), locked_until=None)
+            )
+            await session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при пометке выплаты {outbox_id} как неудавшейся: {e}")
+            await session.rollback()
+            raise
+
+
+class BroadcastCRUD:
+    """Класс для работы с рассылками"""
+
+    @staticmethod
+    async def create(session: AsyncSession, text: str) -> Broadcast:
+        """Создать рассылку"""
+        try:
+            broadcast = Broadcast(text=text, status=BroadcastStatus.RUNNING, last_user_id=0, sent=0, failed=0)
+            session.add(broadcast)
+            await session.commit()
+            await session.refresh(broadcast)
+            return broadcast
+        except Exception as e:
+            logger.error(f"Ошибка при создании рассылки: {e}")
+            await session.rollback()
+            raise
+
+    @staticmethod
+    async def get_resumable(session: AsyncSession) -> Optional[Broadcast]:
+        """Последняя незавершённая рассылка (прервана остановкой или падением процесса)"""
+        result = await session.execute(
+            select(Broadcast)
+            .where(Broadcast.status.in_([BroadcastStatus.RUNNING, BroadcastStatus.INTERRUPTED]))
+            .order_by(Broadcast.id.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def stream_recipients(session: AsyncSession, after_user_id: int,
+                                chunk_size: int = 500) -> AsyncIterator[List[Tuple[int, int]]]:
+        """
+        Пачки (users.id, telegram_id) по возрастанию id начиная после after_user_id.
+        Читается серверным курсором (stream + yield_per): вся таблица в память не загружается.
+        """
+        result = await session.stream(
+            select(User.id, User.telegram_id)
+            .where(User.id > after_user_id)
+            .order_by(User.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+
+    @staticmethod
+    async def checkpoint(session: AsyncSession, broadcast_id: int, last_user_id: int,
+                         sent: int, failed: int, failures: List[Tuple[int, str, str]]) -> None:
+        """Сохранить прогресс рассылки и неудачные доставки пачки одним коммитом"""
+        try:
+            for user_telegram_id, reason, error in failures:
+                session.add(BroadcastFailure(
+                    broadcast_id=broadcast_id,
+                    user_telegram_id=user_telegram_id,
+                    reason=reason,
+                    error=error,
+                ))
+            await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id)
+                .values(last_user_id=last_user_id, sent=sent, failed=failed)
+            )
+            await session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении прогресса рассылки {broadcast_id}: {e}")
+            await session.rollback()
+            raise
+
+    @staticmethod
+    async def set_status(session: AsyncSession, broadcast_id: int, status: BroadcastStatus) -> None:
+        """Изменить статус рассылки"""
+        try:
+            values = {"status": status}
+            if status in (BroadcastStatus.COMPLETED, BroadcastStatus.CANCELLED):
+                values["finished_at"] = datetime.utcnow()
+            await session.execute(update(Broadcast).where(Broadcast.id == broadcast_id).values(**values))
+            await session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при смене статуса рассылки {broadcast_id}: {e}")
+            await session.rollback()
+            raise
@@ -1,24 +1,19 @@
 """
 Скрипт для инициализации базы данных
 Запускать перед первым запуском бота: python -m database.init_db
+(то же, что alembic upgrade head; существующая БД без миграций размечается базовой ревизией)
 """
 
 import asyncio
-from database.database import engine
-from database.models import Base
+from database.database import init_db
 
 
 async def init_database():
-    """Создает все таблицы в базе данных"""
-    async with engine.begin() as conn:
-        # Удаляем старые таблицы (ОСТОРОЖНО! Удалит все данные)
-        # await conn.run_sync(Base.metadata.drop_all)
-        
-        # Создаем новые таблицы
-        await conn.run_sync(Base.metadata.create_all)
+    """Применяет миграции схемы"""
+    await init_db()
     
     print("✅ База данных успешно инициализирована!")
 
 
 if __name__ == "__main__":
-    asyncio.run(init_database())
\ No newline at end of file
+    asyncio.run(init_database())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Enum as SQLEnum, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Enum as SQLEnum, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -22,6 +22,19 @@ class TransactionStatus(enum.Enum):
     PAID = "paid"
     EXPIRED = "expired"
 
+class OutboxStatus(enum.Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    ISSUING = "issuing"
+    DONE = "done"
+    FAILED = "failed"
+
+class BroadcastStatus(enum.Enum):
+    RUNNING = "running"
+    INTERRUPTED = "interrupted"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+
 # ========================== 
 # МОДЕЛИ
 # ==========================
@@ -54,6 +67,11 @@ class User(Base):
 class Game(Base):
     """Модель игры"""
     __tablename__ = "games"
+    __table_args__ = (
+        # Игры пользователя по статусу и типу (статистика) и по времени (история)
+        Index("ix_games_user_status_type", "user_id", "status", "game_type"),
+        Index("ix_games_user_created", "user_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     game_id = Column(String(100), unique=True, nullable=False, index=True)
@@ -83,9 +101,32 @@ class Game(Base):
     def __repr__(self):
         return f"<Game(id={self.id}, game_id={self.game_id}, type={self.game_type}, status={self.status})>"
 
+class UserGameStats(Base):
+    """
+    Агрегаты по пользователю и типу игры для экрана статистики.
+    Обновляются в той же транзакции, что и завершение игры.
+    """
+    __tablename__ = "user_game_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    game_type = Column(String(50), primary_key=True)
+    
+    games_count = Column(Integer, default=0, nullable=False)
+    wagered = Column(Float, default=0.0, nullable=False)
+    won = Column(Float, default=0.0, nullable=False)
+    max_payout = Column(Float, default=0.0, nullable=False)
+    
+    def __repr__(self):
+        return f"<UserGameStats(user_id={self.user_id}, game_type={self.game_type}, games_count={self.games_count})>"
+
 class Transaction(Base):
     """Модель транзакции"""
     __tablename__ = "transactions"
+    __table_args__ = (
+        # История транзакций пользователя и выборка PENDING-счетов для сверки
+        Index("ix_transactions_user_created", "user_id", "created_at"),
+        Index("ix_transactions_status_created", "status", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     invoice_id = Column(String(255), unique=True, nullable=False, index=True)
@@ -109,4 +150,73 @@ class Transaction(Base):
     game = relationship("Game", back_populates="transaction")
     
     def __repr__(self):
-        return f"<Transaction(id={self.id}, invoice_id={self.invoice_id}, status={self.status})>"
\ No newline at end of file
+        return f"<Transaction(id={self.id}, invoice_id={self.invoice_id}, status={self.status})>"
+
+class PayoutOutbox(Base):
+    """Outbox выплат: пишется в одной транзакции с завершением игры"""
+    __tablename__ = "payout_outbox"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    game_id = Column(Integer, ForeignKey("games.id", ondelete="CASCADE"), nullable=False, unique=True)
+    user_telegram_id = Column(BigInteger, nullable=False)
+    
+    # Данные выплаты (amount — в USD, пересчёт в актив при создании чека)
+    asset = Column(String(10), nullable=False)
+    amount = Column(Float, nullable=False)
+    
+    # Состояние обработки
+    status = Column(SQLEnum(OutboxStatus), default=OutboxStatus.PENDING, nullable=False, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    locked_until = Column(DateTime, nullable=True)
+    check_url = Column(String(500), nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    # Временные метки
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+    
+    # Связи
+    game = relationship("Game")
+    
+    def __repr__(self):
+        return f"<PayoutOutbox(id={self.id}, game_id={self.game_id}, status={self.status})>"
+
+class Broadcast(Base):
+    """Рассылка администратора с чекпоинтом прогресса"""
+    __tablename__ = "broadcasts"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    text = Column(Text, nullable=False)
+    status = Column(SQLEnum(BroadcastStatus), default=BroadcastStatus.RUNNING, nullable=False, index=True)
+    
+    # Чекпоинт: все пользователи с users.id <= last_user_id уже обработаны
+    last_user_id = Column(Integer, default=0, nullable=False)
+    sent = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    
+    # Временные метки
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    
+    # Связи
+    failures = relationship("BroadcastFailure", back_populates="broadcast", cascade="all, delete-orphan")
+    
+    def __repr__(self):
+        return f"<Broadcast(id={self.id}, status={self.status}, last_user_id={self.last_user_id})>"
+
+class BroadcastFailure(Base):
+    """Получатель, которому не удалось доставить рассылку (заблокировал бота, удалён и т.п.)"""
+    __tablename__ = "broadcast_failures"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    broadcast_id = Column(Integer, ForeignKey("broadcasts.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_telegram_id = Column(BigInteger, nullable=False)
+    reason = Column(String(50), nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Связи
+    broadcast = relationship("Broadcast", back_populates="failures")
+    
+    def __repr__(self):
+        return f"<BroadcastFailure(broadcast_id={self.broadcast_id}, user_telegram_id={self.user_telegram_id}, reason={self.reason})>"
@@ -0,0 +1,269 @@
+"""
+Локальная заглушка CryptoBot (Crypto Pay API) для нагрузочного тестирования.
+
+Запуск: python -m loadtest.fake_cryptobot --port 8081 --webhook http://127.0.0.1:8000/webhook-secret-path
+В .env бота: CRYPTOBOT_API_URL=http://127.0.0.1:8081/api
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import random
+import time
+from typing import Dict, Optional
+
+import aiohttp
+from aiohttp import web
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Курсы активов к USD, которые отдаёт getExchangeRates
+FAKE_RATES = {"USDT": 1.0, "BUSD": 1.0, "TON": 5.0, "TRX": 0.1, "LTC": 70.0, "ETH": 3000.0, "BTC": 60000.0}
+
+
+class FakeCryptoBot:
+    """In-memory реализация нужных нам методов Crypto Pay API"""
+
+    def __init__(self,
+                 token: str = "fake-token",
+                 webhook_url: Optional[str] = None,
+                 latency_ms: float = 50.0,
+                 jitter_ms: float = 20.0,
+                 auto_pay_after: Optional[float] = None):
+        self.token = token
+        self.webhook_url = webhook_url
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.auto_pay_after = auto_pay_after
+
+        self.invoices: Dict[int, dict] = {}
+        self.checks: Dict[int, dict] = {}
+        self.transfers: Dict[str, dict] = {}
+        self._ids = itertools.count(1)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # Счётчики
+        self.calls: Dict[str, int] = {}
+        self.webhooks_sent = 0
+
+    # ---------- Служебное ----------
+
+    async def _delay(self) -> None:
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code: int, name: str) -> web.Response:
+        return web.json_response({"ok": False, "error": {"code": code, "name": name}})
+
+    def _sign(self, body: bytes) -> str:
+        """Подпись webhook по спецификации Crypto Pay: HMAC-SHA256, ключ = SHA256(token)"""
+        secret = hashlib.sha256(self.token.encode()).digest()
+        return hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+    # ---------- Методы API ----------
+
+    async def create_invoice(self, data: dict) -> web.Response:
+        if "asset" not in data or "amount" not in data:
+            return self._error(400, "ASSET_AND_AMOUNT_REQUIRED")
+        invoice_id = next(self._ids)
+        invoice = {
+            "invoice_id": invoice_id,
+            "hash": f"IV{invoice_id:010d}",
+            "currency_type": "crypto",
+            "asset": data["asset"],
+            "amount": str(data["amount"]),
+            "description": data.get("description", ""),
+            "status": "active",
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "bot_invoice_url": f"https://t.me/CryptoBot?start=IV{invoice_id:010d}",
+            "pay_url": f"https://t.me/CryptoBot?start=IV{invoice_id:010d}",
+        }
+        if data.get("paid_btn_url"):
+            invoice["paid_btn_name"] = data.get("paid_btn_name")
+            invoice["paid_btn_url"] = data["paid_btn_url"]
+        self.invoices[invoice_id] = invoice
+        if self.auto_pay_after is not None:
+            asyncio.get_running_loop().call_later(
+                self.auto_pay_after, lambda: asyncio.ensure_future(self.pay_invoice(invoice_id))
+            )
+        return self._ok(invoice)
+
+    async def get_invoices(self, data: dict) -> web.Response:
+        ids = data.get("invoice_ids")
+        if ids:
+            wanted = [int(i) for i in str(ids).split(",") if i]
+            items = [self.invoices[i] for i in wanted if i in self.invoices]
+        else:
+            items = list(self.invoices.values())
+        if data.get("status"):
+            items = [i for i in items if i["status"] == data["status"]]
+        count = int(data.get("count") or 100)
+        return self._ok({"items": items[:count]})
+
+    async def delete_invoice(self, data: dict) -> web.Response:
+        invoice = self.invoices.get(int(data.get("invoice_id", 0)))
+        if not invoice or invoice["status"] != "active":
+            return self._error(400, "INVOICE_NOT_FOUND")
+        del self.invoices[invoice["invoice_id"]]
+        return self._ok(True)
+
+    async def create_check(self, data: dict) -> web.Response:
+        check_id = next(self._ids)
+        check = {
+            "check_id": check_id,
+            "hash": f"CQ{check_id:010d}",
+            "asset": data.get("asset"),
+            "amount": str(data.get("amount")),
+            "bot_check_url": f"https://t.me/CryptoBot?start=CQ{check_id:010d}",
+            "status": "active",
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+        }
+        self.checks[check_id] = check
+        return self._ok(check)
+
+    async def transfer(self, data: dict) -> web.Response:
+        spend_id = data.get("spend_id")
+        if not spend_id:
+            return self._error(400, "SPEND_ID_REQUIRED")
+        # spend_id делает перевод идемпотентным, как в настоящем API
+        if spend_id not in self.transfers:
+            self.transfers[spend_id] = {
+                "transfer_id": next(self._ids),
+                "user_id": data.get("user_id"),
+                "asset": data.get("asset"),
+                "amount": str(data.get("amount")),
+                "status": "completed",
+                "spend_id": spend_id,
+            }
+        return self._ok(self.transfers[spend_id])
+
+    async def get_exchange_rates(self, data: dict) -> web.Response:
+        return self._ok([
+            {"is_valid": True, "is_crypto": True, "is_fiat": False,
+             "source": asset, "target": "USD", "rate": str(rate)}
+            for asset, rate in FAKE_RATES.items()
+        ])
+
+    async def get_me(self, data: dict) -> web.Response:
+        return self._ok({"app_id": 1, "name": "FakeCasino", "payment_processing_bot_username": "CryptoBot"})
+
+    # ---------- Оплата и webhook ----------
+
+    async def pay_invoice(self, invoice_id: int) -> bool:
+        """Пометить счёт оплаченным и отправить invoice_paid на наш webhook"""
+        invoice = self.invoices.get(invoice_id)
+        if not invoice or invoice["status"] != "active":
+            return False
+        invoice["status"] = "paid"
+        invoice["paid_at"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+        if self.webhook_url:
+            await self._send_webhook(invoice)
+        return True
+
+    async def _send_webhook(self, invoice: dict) -> None:
+        update = {
+            "update_id": next(self._ids),
+            "update_type": "invoice_paid",
+            "request_date": invoice["paid_at"],
+            "payload": invoice,
+        }
+        body = json.dumps(update).encode()
+        headers = {"Content-Type": "application/json", "crypto-pay-api-signature": self._sign(body)}
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        try:
+            async with self._session.post(self.webhook_url, data=body, headers=headers) as resp:
+                self.webhooks_sent += 1
+                logger.debug(f"invoice_paid {invoice['invoice_id']} -> {resp.status}")
+        except aiohttp.ClientError as e:
+            logger.error(f"Не удалось доставить webhook: {e}")
+
+    # ---------- HTTP ----------
+
+    async def handle_api(self, request: web.Request) -> web.Response:
+        if request.headers.get("Crypto-Pay-API-Token") != self.token:
+            return self._error(401, "UNAUTHORIZED")
+
+        method = request.match_info["method"]
+        handler = {
+            "createInvoice": self.create_invoice,
+            "getInvoices": self.get_invoices,
+            "deleteInvoice": self.delete_invoice,
+            "createCheck": self.create_check,
+            "transfer": self.transfer,
+            "getExchangeRates": self.get_exchange_rates,
+            "getMe": self.get_me,
+        }.get(method)
+        if handler is None:
+            return self._error(405, "METHOD_NOT_FOUND")
+
+        if request.method == "POST" and request.can_read_body:
+            data = await request.json()
+        else:
+            data = dict(request.query)
+
+        self.calls[method] = self.calls.get(method, 0) + 1
+        await self._delay()
+        return await handler(data)
+
+    async def handle_pay(self, request: web.Request) -> web.Response:
+        """POST /control/pay/{invoice_id} — сымитировать оплату счёта"""
+        paid = await self.pay_invoice(int(request.match_info["invoice_id"]))
+        return web.json_response({"ok": paid})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "calls": self.calls,
+            "invoices": len(self.invoices),
+            "checks": len(self.checks),
+            "webhooks_sent": self.webhooks_sent,
+        })
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/api/{method}", self.handle_api)
+        app.router.add_post("/control/pay/{invoice_id}", self.handle_pay)
+        app.router.add_get("/control/stats", self.handle_stats)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка CryptoBot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token", default="fake-token", help="значение cryptobot_token бота")
+    parser.add_argument("--webhook", default=None, help="URL нашего webhook для invoice_paid")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--auto-pay-after", type=float, default=None,
+                        help="автоматически оплачивать счета через N секунд")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeCryptoBot(
+        token=args.token,
+        webhook_url=args.webhook,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        auto_pay_after=args.auto_pay_after,
+    )
+    web.run_app(fake.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Локальная заглушка Telegram Bot API для нагрузочного тестирования.
+
+Запуск: python -m loadtest.fake_telegram --port 8082
+В .env бота: TELEGRAM_API_URL=http://127.0.0.1:8082
+
+Для INGEST_MODE=polling: POST /control/updates?count=10000&users=500
+кладёт синтетические /start в очередь, которую отдаёт getUpdates.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict
+
+from aiohttp import web
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Максимальное значение Dice для каждого эмодзи
+DICE_MAX = {"🎲": 6, "🎯": 6, "🎳": 6, "🏀": 5, "⚽": 5, "⚽️": 5, "🎰": 64}
+
+
+class FakeTelegram:
+    """In-memory реализация методов Bot API, которые вызывает бот"""
+
+    def __init__(self, latency_ms: float = 40.0, jitter_ms: float = 15.0,
+                 username: str = "fake_casino_bot"):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.username = username
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._updates: Deque[dict] = deque()
+        self._updates_ready = asyncio.Event()
+
+        # Счётчики
+        self.calls: Dict[str, int] = {}
+
+    async def _delay(self) -> None:
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _chat(chat_id) -> dict:
+        return {"id": int(chat_id), "type": "private", "first_name": "Load"}
+
+    def _message(self, chat_id, **fields) -> dict:
+        message = {
+            "message_id": fields.pop("message_id", None) or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": self.username},
+        }
+        message.update(fields)
+        return message
+
+    # ---------- Методы API ----------
+
+    async def get_me(self, data: dict, token: str) -> dict:
+        bot_id = int(token.split(":")[0]) if ":" in token and token.split(":")[0].isdigit() else 1
+        return {
+            "id": bot_id,
+            "is_bot": True,
+            "first_name": "FakeBot",
+            "username": self.username,
+            "can_join_groups": True,
+            "can_read_all_group_messages": False,
+            "supports_inline_queries": False,
+        }
+
+    async def send_message(self, data: dict, token: str) -> dict:
+        return self._message(data["chat_id"], text=data.get("text", ""))
+
+    async def send_dice(self, data: dict, token: str) -> dict:
+        emoji = data.get("emoji") or "🎲"
+        value = random.randint(1, DICE_MAX.get(emoji, 6))
+        return self._message(data["chat_id"], dice={"emoji": emoji, "value": value})
+
+    async def edit_message_text(self, data: dict, token: str) -> dict:
+        return self._message(
+            data.get("chat_id", 0),
+            message_id=int(data.get("message_id") or 0),
+            text=data.get("text", ""),
+            edit_date=int(time.time()),
+        )
+
+    async def get_updates(self, data: dict, token: str) -> list:
+        offset = int(data.get("offset") or 0)
+        limit = int(data.get("limit") or 100)
+        timeout = float(data.get("timeout") or 0)
+
+        # Подтверждённые (offset) обновления удаляются, как в Bot API
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._updates, limit))
+
+    async def return_true(self, data: dict, token: str) -> bool:
+        return True
+
+    # ---------- HTTP ----------
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.match_info["token"]
+        method = request.match_info["method"]
+        handler = {
+            "getMe": self.get_me,
+            "sendMessage": self.send_message,
+            "sendDice": self.send_dice,
+            "editMessageText": self.edit_message_text,
+            "getUpdates": self.get_updates,
+        }.get(method, self.return_true)  # setWebhook, deleteMessage, answerCallbackQuery и т.п.
+
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        for key in ("reply_markup", "entities"):
+            if isinstance(data.get(key), str):
+                data[key] = json.loads(data[key])
+
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method != "getUpdates":
+            await self._delay()
+        return self._ok(await handler(data, token))
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": self.calls, "pending_updates": len(self._updates)})
+
+    async def handle_enqueue_updates(self, request: web.Request) -> web.Response:
+        """Сгенерировать count сообщений /start от users пользователей"""
+        count = int(request.query.get("count", 1000))
+        users = int(request.query.get("users", 100))
+        for i in range(count):
+            user_id = 100000 + i % users
+            self._updates.append({
+                "update_id": next(self._update_ids),
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": self._chat(user_id),
+                    "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+                    "text": "/start",
+                    "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+                },
+            })
+        self._updates_ready.set()
+        return web.json_response({"enqueued": count, "pending_updates": len(self._updates)})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/control/stats", self.handle_stats)
+        app.router.add_post("/control/updates", self.handle_enqueue_updates)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--jitter-ms", type=float, default=15.0)
+    parser.add_argument("--username", default="fake_casino_bot")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeTelegram(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, username=args.username)
+    web.run_app(fake.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
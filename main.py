@@ -1,17 +1,39 @@
 import asyncio
+import hmac
 import logging
 from contextlib import asynccontextmanager
+from typing import Optional
 
 import uvicorn
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 
 from bot import handlers
 from bot.handlers import router
-from config import BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PATH
-from database.database import init_db
-from payment.webhook import setup_webhooks, set_webhook_bot, set_webhook_dispatcher
+from bot.broadcast import broadcaster
+from bot.metadata import bot_metadata
+from bot.outbound import outbound_scheduler
+from bot.polling import update_poller
+from bot.storage import create_fsm_storage, CachedRedisStorage, FSMUpdateScopeMiddleware
+from bot.update_dispatcher import update_dispatcher
+from config import BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PATH, settings
+from database.crud import HOT_LOOKUPS, user_cache
+from database.database import init_db, warmup_pool, get_pool_stats
+from payment.webhook import (
+    setup_webhooks, set_webhook_bot, set_webhook_dispatcher,
+    deliver_payout, notify_payout_failed, ingress_stats, payment_stats, payment_queue, drain_reveals,
+    TELEGRAM_SECRET_TOKEN,
+)
+from payment.cryptobot import cryptobot
+from payment.payouts import payout_queue
+from payment.outbox_relay import outbox_relay
+from payment.reconciler import invoice_reconciler
+from payment.exchange_rates import usd_rub_cache, asset_rates_cache
+from payment.invoice_pool import invoice_pool
+from utils.http_client import http_client
 
 # Настройка логирования
 logging.basicConfig(
@@ -33,31 +55,80 @@ async def lifespan(app: FastAPI):
     
     try:
         # Инициализация базы данных
-        logger.info("Инициализация базы данных...")
-        await init_db()
-        print("База данных инициализирована!")
-        logger.info("База данных инициализирована!")
+        if settings.DB_AUTO_MIGRATE:
+            logger.info("Инициализация базы данных...")
+            await init_db()
+            print("База данных инициализирована!")
+            logger.info("База данных инициализирована!")
+        if settings.DB_WARMUP:
+            await warmup_pool(HOT_LOOKUPS)
+
+        # Общий HTTP-клиент для исходящих запросов
+        await http_client.start()
+
+        # Кэш курса USD/RUB с фоновым обновлением
+        await usd_rub_cache.start()
+        await asset_rates_cache.start()
 
         # Инициализация бота
         logger.info("Инициализация бота...")
-        bot = Bot(token=BOT_TOKEN, parse_mode=ParseMode.HTML)
-        dp = Dispatcher()
+        session = None
+        if settings.TELEGRAM_API_URL:
+            # Локальный Bot API сервер или заглушка для нагрузочных тестов
+            session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
+        bot = Bot(token=BOT_TOKEN, session=session, parse_mode=ParseMode.HTML)
+        # Все исходящие сообщения идут через планировщик с лимитами Telegram
+        bot.session.middleware(outbound_scheduler)
+        await outbound_scheduler.start()
+        dp = Dispatcher(storage=create_fsm_storage())
+        # Повторные чтения FSM в пределах апдейта — из кэша, между апдейтами — из Redis
+        dp.update.outer_middleware(FSMUpdateScopeMiddleware())
         dp.include_router(router)
         
+        # Метаданные бота (username, id) — один запрос getMe на старте
+        await bot_metadata.load(bot)
+
         # Передаём экземпляр бота в хендлеры
         handlers.set_bot(bot)
+        broadcaster.set_bot(bot)
         
         # Передаём бот и диспетчер в webhook
         set_webhook_bot(bot)
         set_webhook_dispatcher(dp)
 
-        # Установка Telegram webhook
+        # Шарды обработки обновлений Telegram (порядок внутри пользователя)
+        update_dispatcher.set_target(bot, dp)
+        await update_dispatcher.start()
+
+        # Очередь обработки оплаченных счетов
+        await payment_queue.start()
+
+        # Очередь выплат и outbox relay: чеки создаются в фоне и доставляются пользователю
+        outbox_relay.set_handlers(on_delivered=deliver_payout, on_failed=notify_payout_failed)
+        await payout_queue.start()
+        await outbox_relay.start()
+
+        # Сверка PENDING-счетов на случай пропущенных webhook
+        await invoice_reconciler.start()
+
         webhook_url = f"{WEBHOOK_URL}{WEBHOOK_PATH}"
-        await bot.set_webhook(
-            url=webhook_url,
-            drop_pending_updates=True
-        )
-        logger.info(f"Telegram webhook установлен: {webhook_url}")
+        if settings.INGEST_MODE == "polling":
+            # getUpdates не работает при установленном webhook
+            await bot.delete_webhook(drop_pending_updates=False)
+            update_poller.set_bot(bot)
+            await update_poller.start()
+        else:
+            # Установка Telegram webhook
+            await bot.set_webhook(
+                url=webhook_url,
+                secret_token=TELEGRAM_SECRET_TOKEN,
+                drop_pending_updates=True
+            )
+            logger.info(f"Telegram webhook установлен: {webhook_url}")
+
+        # Пул заранее выставленных счетов для стандартных ставок
+        if settings.INVOICE_POOL_ENABLED:
+            await invoice_pool.start()
         
         print("\n" + "="*60)
         print("ВАЖНО: Настрой CryptoBot webhook вручную!")
@@ -77,10 +148,27 @@ async def lifespan(app: FastAPI):
         logger.error(f"Ошибка при инициализации: {e}")
         raise
     finally:
-        # Очистка при остановке
+        # Очистка при остановке: сначала дорабатываем принятые платежи
+        await invoice_reconciler.stop()
+        await broadcaster.stop()
+        await update_poller.stop()
+        await update_dispatcher.stop()
+        await payment_queue.stop(timeout=settings.PAYMENT_QUEUE_DRAIN_TIMEOUT)
+        await invoice_pool.stop()
+        await outbox_relay.stop()
+        await payout_queue.stop(timeout=settings.PAYOUT_DRAIN_TIMEOUT)
+        await usd_rub_cache.stop()
+        await asset_rates_cache.stop()
+        # Результаты уже оплаченных игр ждут конца анимации — отправляем до остановки планировщика
+        await drain_reveals(timeout=settings.RESULT_REVEAL_DRAIN_TIMEOUT)
+        await outbound_scheduler.stop(timeout=settings.TELEGRAM_OUTBOUND_DRAIN_TIMEOUT)
         if bot:
-            await bot.delete_webhook(drop_pending_updates=True)
+            if settings.INGEST_MODE != "polling":
+                await bot.delete_webhook(drop_pending_updates=True)
             await bot.session.close()
+        if dp:
+            await dp.storage.close()
+        await http_client.close()
         logger.info("Бот остановлен")
 
 
@@ -91,6 +179,33 @@ app = FastAPI(lifespan=lifespan)
 setup_webhooks(app)
 
 
+@app.get("/metrics")
+async def metrics(x_metrics_token: Optional[str] = Header(default=None)):
+    """Состояние фоновых подсистем и внешних зависимостей для мониторинга (по X-Metrics-Token)"""
+    # Приложение смотрит в интернет ради webhook: без токена метрики не отдаём вовсе
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404)
+    if x_metrics_token is None or not hmac.compare_digest(x_metrics_token, settings.METRICS_TOKEN):
+        raise HTTPException(status_code=401)
+    return {
+        "cryptobot_breaker": cryptobot.resilience_stats(),
+        "invoice_pool": invoice_pool.stats(),
+        "payouts": payout_queue.stats(),
+        "outbox": outbox_relay.stats(),
+        "reconciler": invoice_reconciler.stats(),
+        "ingress": ingress_stats,
+        "payments": payment_stats,
+        "payment_queue": payment_queue.stats(),
+        "updates": update_dispatcher.stats(),
+        "polling": update_poller.stats(),
+        "telegram_outbound": outbound_scheduler.stats(),
+        "broadcast": broadcaster.stats(),
+        "db_pool": get_pool_stats(),
+        "user_cache": user_cache.stats(),
+        "fsm": dp.storage.stats() if isinstance(dp.storage, CachedRedisStorage) else None,
+    }
+
+
 async def main():
     """Точка входа"""
     config = uvicorn.Config(
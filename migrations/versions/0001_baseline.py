@@ -0,0 +1,153 @@
+"""Базовая схема: все таблицы моделей на момент перехода на Alembic
+
+Кроме исходных users, games и transactions сюда входят таблицы, появившиеся
+до миграций: user_game_stats, payout_outbox, broadcasts и broadcast_failures.
+БД, созданная раньше через create_all, может содержать только часть из них,
+поэтому init_db перед разметкой этой ревизией досоздаёт недостающие таблицы
+(create_all с checkfirst). Размечать такую БД вручную (alembic stamp) можно
+только после того же шага.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+game_status = sa.Enum("PENDING", "COMPLETED", name="gamestatus")
+game_result = sa.Enum("WIN", "LOSS", "DRAW", name="gameresult")
+transaction_status = sa.Enum("PENDING", "PAID", "EXPIRED", name="transactionstatus")
+outbox_status = sa.Enum("PENDING", "PROCESSING", "DONE", "FAILED", name="outboxstatus")
+broadcast_status = sa.Enum("RUNNING", "INTERRUPTED", "COMPLETED", "CANCELLED", name="broadcaststatus")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("telegram_id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=255), nullable=True),
+        sa.Column("first_name", sa.String(length=255), nullable=True),
+        sa.Column("total_wagered", sa.Float(), nullable=True),
+        sa.Column("total_won", sa.Float(), nullable=True),
+        sa.Column("games_played", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("last_activity", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_telegram_id", "users", ["telegram_id"], unique=True)
+
+    op.create_table(
+        "games",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("game_id", sa.String(length=100), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("game_type", sa.String(length=50), nullable=False),
+        sa.Column("bet_amount", sa.Float(), nullable=False),
+        sa.Column("currency", sa.String(length=10), nullable=True),
+        sa.Column("status", game_status, nullable=True),
+        sa.Column("result", game_result, nullable=True),
+        sa.Column("payout", sa.Float(), nullable=True),
+        sa.Column("game_data", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_games_game_id", "games", ["game_id"], unique=True)
+
+    op.create_table(
+        "user_game_stats",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("game_type", sa.String(length=50), nullable=False),
+        sa.Column("games_count", sa.Integer(), nullable=False),
+        sa.Column("wagered", sa.Float(), nullable=False),
+        sa.Column("won", sa.Float(), nullable=False),
+        sa.Column("max_payout", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "game_type"),
+    )
+
+    op.create_table(
+        "transactions",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("invoice_id", sa.String(length=255), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("game_id", sa.Integer(), nullable=True),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("currency", sa.String(length=10), nullable=True),
+        sa.Column("status", transaction_status, nullable=True),
+        sa.Column("pay_url", sa.String(length=500), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("paid_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["game_id"], ["games.id"], ondelete="SET NULL"),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_transactions_invoice_id", "transactions", ["invoice_id"], unique=True)
+
+    op.create_table(
+        "payout_outbox",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("game_id", sa.Integer(), nullable=False),
+        sa.Column("user_telegram_id", sa.BigInteger(), nullable=False),
+        sa.Column("asset", sa.String(length=10), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("status", outbox_status, nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("locked_until", sa.DateTime(), nullable=True),
+        sa.Column("check_url", sa.String(length=500), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("processed_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["game_id"], ["games.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("game_id"),
+    )
+    op.create_index("ix_payout_outbox_status", "payout_outbox", ["status"])
+
+    op.create_table(
+        "broadcasts",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("status", broadcast_status, nullable=False),
+        sa.Column("last_user_id", sa.Integer(), nullable=False),
+        sa.Column("sent", sa.Integer(), nullable=False),
+        sa.Column("failed", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_broadcasts_status", "broadcasts", ["status"])
+
+    op.create_table(
+        "broadcast_failures",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("broadcast_id", sa.Integer(), nullable=False),
+        sa.Column("user_telegram_id", sa.BigInteger(), nullable=False),
+        sa.Column("reason", sa.String(length=50), nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["broadcast_id"], ["broadcasts.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_broadcast_failures_broadcast_id", "broadcast_failures", ["broadcast_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("broadcast_failures")
+    op.drop_table("broadcasts")
+    op.drop_table("payout_outbox")
+    op.drop_table("transactions")
+    op.drop_table("user_game_stats")
+    op.drop_table("games")
+    op.drop_table("users")
+    for enum_type in (broadcast_status, outbox_status, transaction_status, game_result, game_status):
+        enum_type.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,59 @@
+"""Составные индексы для горячих запросов (CREATE INDEX CONCURRENTLY)
+
+Индексы строятся без блокировки записи в таблицы, поэтому миграцию можно
+применять на работающем проде. CONCURRENTLY нельзя выполнять внутри транзакции —
+каждый индекс создаётся в autocommit_block. Прерванный CREATE INDEX CONCURRENTLY
+оставляет невалидный индекс (indisvalid = false): при повторном запуске он
+удаляется и строится заново.
+
+Revision ID: 0002_hot_query_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18 00:00:01
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002_hot_query_indexes"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+
+# (имя, таблица, колонки); ведущий user_id покрывает и выборки по одному user_id
+INDEXES = [
+    ("ix_games_user_status_type", "games", ["user_id", "status", "game_type"]),
+    ("ix_games_user_created", "games", ["user_id", "created_at"]),
+    ("ix_transactions_user_created", "transactions", ["user_id", "created_at"]),
+    ("ix_transactions_status_created", "transactions", ["status", "created_at"]),
+]
+
+
+def _is_invalid(name: str) -> bool:
+    """Индекс существует, но остался невалидным после прерванного CONCURRENTLY"""
+    return op.get_bind().execute(
+        sa.text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": name},
+    ).scalar() is not None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if _is_invalid(name):
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            # IF NOT EXISTS: валидный индекс из прерванного ранее запуска не пересоздаём
+            op.create_index(
+                name, table, columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
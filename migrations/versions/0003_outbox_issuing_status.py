@@ -0,0 +1,32 @@
+"""Статус ISSUING в outbox выплат
+
+Запись переводится в ISSUING перед запросом createCheck и больше не
+захватывается повторно по истечении аренды — зависшие записи уходят
+на ручную сверку. ALTER TYPE ... ADD VALUE до PostgreSQL 12 нельзя
+выполнять внутри транзакции, поэтому — autocommit_block.
+
+Revision ID: 0003_outbox_issuing_status
+Revises: 0002_hot_query_indexes
+Create Date: 2026-10-18 00:00:02
+"""
+from alembic import op
+
+
+revision = "0003_outbox_issuing_status"
+down_revision = "0002_hot_query_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE outboxstatus ADD VALUE IF NOT EXISTS 'ISSUING' AFTER 'PROCESSING'")
+
+
+def downgrade() -> None:
+    # Значение из enum в PostgreSQL не удаляется; зависшие записи отдаём на ручной разбор
+    op.execute(
+        "UPDATE payout_outbox SET status = 'FAILED', "
+        "last_error = 'ISSUING при откате миграции: требуется ручная сверка' "
+        "WHERE status = 'ISSUING'"
+    )
@@ -1,66 +1,180 @@
-import aiohttp
+import asyncio
 import hmac
 import hashlib
-import uuid
+import aiohttp
 from typing import Dict, Optional
 from config import settings
 from utils.logger import logger
-from database.crud import UserCRUD, GameCRUD, TransactionCRUD
-from database.database import async_session_maker
-from datetime import datetime
+from utils.http_client import http_client
+from payment.resilience import CircuitBreaker, backoff_delay, hedged
+
+
+class CryptoBotError(Exception):
+    """Ошибка, которую вернул CryptoBot API (ok=false)"""
+
+    def __init__(self, method: str, response: Dict):
+        self.method = method
+        self.response = response
+        error = response.get("error") or {}
+        self.code = error.get("code") if isinstance(error, dict) else None
+        super().__init__(f"CryptoBot {method} error: {response}")
+
+    @property
+    def retryable(self) -> bool:
+        """Можно ли безопасно повторить запрос (лимиты и ошибки сервера)"""
+        return self.code == 429 or (self.code is not None and self.code >= 500)
 
 
 class CryptoBotAPI:
-    BASE_URL = "https://pay.crypt.bot/api"
+    BASE_URL = settings.CRYPTOBOT_API_URL
     SUPPORTED_ASSETS = ["TON", "USDT", "BTC", "ETH", "LTC", "TRX", "BUSD"]
 
-    def __init__(self, token: str):
+    # Бюджет времени на один запрос к каждому методу, секунды
+    LATENCY_BUDGETS = {
+        "createInvoice": 5.0,
+        "createCheck": 8.0,
+        "transfer": 8.0,
+        "getInvoices": 3.0,
+        "getExchangeRates": 3.0,
+        "deleteInvoice": 3.0,
+    }
+    DEFAULT_BUDGET = 5.0
+
+    # Методы, которые безопасно повторять (transfer идемпотентен за счёт spend_id)
+    IDEMPOTENT_METHODS = {"getInvoices", "getExchangeRates", "deleteInvoice", "transfer"}
+    # Методы только на чтение — для них допустимы hedged-запросы
+    READ_METHODS = {"getInvoices", "getExchangeRates"}
+
+    def __init__(self, token: str,
+                 max_retries: int = 2,
+                 hedge_delay: Optional[float] = None,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
         self.token = token
         self.headers = {
             "Crypto-Pay-API-Token": token,
             "Content-Type": "application/json"
         }
-
-    async def create_invoice(self, asset: str, amount: float, description: str) -> Dict:
+        self.max_retries = max_retries
+        self.hedge_delay = hedge_delay
+        self.breaker = CircuitBreaker("CryptoBot", failure_threshold, reset_timeout)
+
+    async def _send(self, method: str, data: Dict) -> Dict:
+        """Один HTTP-запрос к CryptoBot API через общий пул соединений"""
+        url = f"{self.BASE_URL}/{method}"
+        timeout = aiohttp.ClientTimeout(total=self.LATENCY_BUDGETS.get(method, self.DEFAULT_BUDGET))
+        async with http_client.session.post(url, headers=self.headers, json=data, timeout=timeout) as resp:
+            result = await resp.json()
+            if not result.get('ok'):
+                raise CryptoBotError(method, result)
+            return result['result']
+
+    async def _guarded(self, method: str, data: Dict) -> Dict:
+        """Запрос через предохранитель: учитываем только сбои API, не бизнес-ошибки"""
+        self.breaker.before_call()
+        try:
+            result = await self._send(method, data)
+        except CryptoBotError as e:
+            if e.retryable:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Отменённый (hedged, остановка) пробный запрос в HALF_OPEN иначе навсегда занял бы слот
+            self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _request(self, method: str, data: Dict) -> Dict:
+        """
+        Выполнить запрос к CryptoBot API: бюджет времени на метод, предохранитель,
+        повторы с джиттером для идемпотентных методов и hedged-запросы для чтения.
+        """
+        retries = self.max_retries if method in self.IDEMPOTENT_METHODS else 0
+        attempt = 0
+        while True:
+            try:
+                if self.hedge_delay and method in self.READ_METHODS:
+                    return await hedged(lambda: self._guarded(method, data), self.hedge_delay)
+                return await self._guarded(method, data)
+            except (CryptoBotError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, CryptoBotError) and not e.retryable:
+                    raise
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                delay = backoff_delay(attempt)
+                logger.warning(f"CryptoBot {method}: повтор {attempt}/{retries} через {delay:.2f}s ({e!r})")
+                await asyncio.sleep(delay)
+
+    def resilience_stats(self) -> dict:
+        """Состояние предохранителя для мониторинга"""
+        return self.breaker.stats()
+
+    async def create_invoice(self, asset: str, amount: float, description: str,
+                             paid_btn_url: Optional[str] = None,
+                             expires_in: Optional[int] = None) -> Dict:
         """Создать счёт на оплату"""
         if asset not in self.SUPPORTED_ASSETS:
             raise ValueError(f"❌ Unsupported asset: {asset}")
 
-        url = f"{self.BASE_URL}/createInvoice"
         data = {
             "asset": asset,
             "amount": str(amount),
             "description": description
         }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=self.headers, json=data) as resp:
-                result = await resp.json()
-                if not result.get('ok'):
-                    raise Exception(f"CryptoBot error: {result}")
-                return result['result']
+        # Используем ТОЛЬКО разрешённые значения для paid_btn_name
+        if paid_btn_url:
+            data["paid_btn_name"] = "openBot"
+            data["paid_btn_url"] = paid_btn_url
+        if expires_in:
+            data["expires_in"] = expires_in
+
+        return await self._request("createInvoice", data)
+
+    async def get_invoices(self, invoice_ids=None, status: Optional[str] = None,
+                           count: Optional[int] = None) -> Dict:
+        """
+        Получить счета. invoice_ids — один id, список id или строка "1,2,3"
+        (один запрос на пачку счетов). Возвращает {"items": [...]}.
+        """
+        data = {}
+        if invoice_ids is not None:
+            if isinstance(invoice_ids, (list, tuple, set)):
+                invoice_ids = ",".join(str(i) for i in invoice_ids)
+            data["invoice_ids"] = str(invoice_ids)
+        if status:
+            data["status"] = status
+        if count:
+            data["count"] = count
+        return await self._request("getInvoices", data)
+
+    async def get_exchange_rates(self) -> list:
+        """Получить курсы обмена (source -> target) от CryptoBot"""
+        return await self._request("getExchangeRates", {})
+
+    async def delete_invoice(self, invoice_id: int) -> bool:
+        """Удалить (отозвать) неоплаченный счёт"""
+        return await self._request("deleteInvoice", {"invoice_id": int(invoice_id)})
 
     async def create_check(self, asset: str, amount: float) -> Dict:
         """Создать чек для выплаты выигрыша"""
         if asset not in self.SUPPORTED_ASSETS:
             raise ValueError(f"❌ Unsupported asset: {asset}")
 
-        url = f"{self.BASE_URL}/createCheck"
         data = {
             "asset": asset,
             "amount": str(amount)
         }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=self.headers, json=data) as resp:
-                result = await resp.json()
-                if not result.get('ok'):
-                    raise Exception(f"Create check error: {result}")
-                return result['result']
+        return await self._request("createCheck", data)
 
     async def transfer(self, user_id: int, asset: str, amount: float, spend_id: str) -> Dict:
         """Перевести средства пользователю (старый метод, оставлен для совместимости)"""
-        url = f"{self.BASE_URL}/transfer"
         data = {
             "user_id": user_id,
             "asset": asset,
@@ -68,77 +182,16 @@ class CryptoBotAPI:
             "spend_id": spend_id,
             "comment": "Выигрыш в казино"
         }
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=self.headers, json=data) as resp:
-                result = await resp.json()
-                if not result.get('ok'):
-                    raise Exception(f"Transfer error: {result}")
-                return result['result']
+        return await self._request("transfer", data)
 
     @staticmethod
     def verify_signature(body: bytes, signature: str, token: str) -> bool:
-        """Проверить подпись webhook"""
-        expected = hmac.new(token.encode(), body, hashlib.sha256).hexdigest()
+        """Проверить подпись webhook (HMAC-SHA256 тела, ключ — SHA256 от токена)"""
+        secret = hashlib.sha256(token.encode()).digest()
+        expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
         return hmac.compare_digest(signature, expected)
 
 
-# =====================================================
-# ✅ Создание пользователя, игры и счёта
-# =====================================================
-async def create_game_and_invoice(telegram_id: int, game_type: str, bet_amount: float, currency: str):
-    """
-    Создаёт пользователя (если нет), игру и выставляет счёт через CryptoBot.
-    """
-    async with async_session_maker() as session:
-        try:
-            # ✅ Проверяем/создаём пользователя
-            user = await UserCRUD.get_or_create(session, telegram_id)
-            logger.info(f"✅ Пользователь {telegram_id} проверен/создан")
-
-            # ✅ Создаём игру
-            game_id = str(uuid.uuid4())
-            game = await GameCRUD.create(
-                session=session,
-                game_id=game_id,
-                user_id=user.id,
-                game_type=game_type,
-                bet_amount=bet_amount,
-                currency=currency
-            )
-            logger.info(f"Игра {game_type} создана (id={game_id})")
-
-            # ✅ Создаём инвойс
-            crypto_api = CryptoBotAPI(settings.cryptobot_token)
-            invoice = await crypto_api.create_invoice(
-                asset=currency,
-                amount=bet_amount,
-                description=f"Игра {game_type}"
-            )
-
-            pay_url = invoice.get("pay_url")
-            invoice_id = invoice.get("invoice_id")
-
-            # ✅ Сохраняем транзакцию
-            await TransactionCRUD.create(
-                session=session,
-                invoice_id=str(invoice_id),
-                user_id=user.id,
-                game_id=game.id,
-                amount=bet_amount,
-                currency=currency,
-                pay_url=pay_url
-            )
-
-            await session.commit()
-            logger.info(f" Счёт создан: {pay_url} ({bet_amount} {currency})")
-            return pay_url
-
-        except Exception as e:
-            logger.error(f" Ошибка в create_game_and_invoice: {e}")
-            raise
-
-
 async def setup_cryptobot_webhook():
     """Автоматическая настройка webhook для CryptoBot"""
     try:
@@ -155,4 +208,10 @@ async def setup_cryptobot_webhook():
 
 
 # Глобальный экземпляр API
-cryptobot = CryptoBotAPI(settings.cryptobot_token)
\ No newline at end of file
+cryptobot = CryptoBotAPI(
+    settings.cryptobot_token,
+    max_retries=settings.CRYPTOBOT_MAX_RETRIES,
+    hedge_delay=settings.CRYPTOBOT_HEDGE_DELAY,
+    failure_threshold=settings.CRYPTOBOT_BREAKER_THRESHOLD,
+    reset_timeout=settings.CRYPTOBOT_BREAKER_RESET,
+)
\ No newline at end of file
@@ -0,0 +1,125 @@
+import logging
+from typing import Dict
+
+from config import settings
+from payment.cryptobot import cryptobot, CryptoBotAPI
+from utils.http_client import http_client
+from utils.refreshing_cache import RefreshingCache
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+DEFAULT_USD_TO_RUB = 82.0
+
+
+# ==========================
+# Источники курса USD -> RUB
+# ==========================
+
+class ExchangeRateAPISource:
+    """Курс USD -> RUB с exchangerate-api.com"""
+
+    URL = "https://api.exchangerate-api.com/v4/latest/USD"
+
+    async def __call__(self) -> float:
+        async with http_client.session.get(self.URL, timeout=5) as resp:
+            if resp.status != 200:
+                raise ValueError(f"exchangerate-api вернул статус {resp.status}")
+            data = await resp.json()
+            rate = data.get('rates', {}).get('RUB')
+            if not rate:
+                raise ValueError("В ответе нет курса RUB")
+            return float(rate)
+
+
+class StaticRateSource:
+    """Локальный источник с фиксированным курсом (для тестов и разработки)"""
+
+    def __init__(self, rate: float = DEFAULT_USD_TO_RUB):
+        self.rate = rate
+
+    async def __call__(self) -> float:
+        return self.rate
+
+
+def _build_source():
+    if settings.FX_STATIC_USD_TO_RUB is not None:
+        return StaticRateSource(settings.FX_STATIC_USD_TO_RUB)
+    return ExchangeRateAPISource()
+
+
+# Глобальный кэш курса USD -> RUB
+usd_rub_cache: RefreshingCache[float] = RefreshingCache(
+    loader=_build_source(),
+    ttl=settings.FX_CACHE_TTL,
+    refresh_interval=settings.FX_REFRESH_INTERVAL,
+    default=DEFAULT_USD_TO_RUB,
+    name="курс USD/RUB",
+)
+
+
+# ==========================
+# Курсы криптовалют (asset -> USD)
+# ==========================
+
+# Стейблкоины считаем равными доллару, пока не пришли курсы
+STABLE_ASSET_RATES = {"USDT": 1.0, "BUSD": 1.0}
+
+# Знаков после запятой при пересчёте суммы в актив
+ASSET_DECIMALS = {"USDT": 2, "BUSD": 2, "TON": 4, "TRX": 4, "LTC": 6, "ETH": 8, "BTC": 8}
+
+
+class CryptoBotRatesSource:
+    """Курсы всех поддерживаемых активов к USD через getExchangeRates"""
+
+    async def __call__(self) -> Dict[str, float]:
+        rates = dict(STABLE_ASSET_RATES)
+        for item in await cryptobot.get_exchange_rates():
+            if not item.get("is_valid") or item.get("target") != "USD":
+                continue
+            source = item.get("source")
+            if source in CryptoBotAPI.SUPPORTED_ASSETS:
+                rates[source] = float(item["rate"])
+        return rates
+
+
+class StaticAssetRatesSource:
+    """Фиксированные курсы активов (для тестов и разработки)"""
+
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = dict(rates)
+
+    async def __call__(self) -> Dict[str, float]:
+        return self.rates
+
+
+def _build_asset_rates_source():
+    if settings.STATIC_ASSET_RATES is not None:
+        return StaticAssetRatesSource({**STABLE_ASSET_RATES, **settings.STATIC_ASSET_RATES})
+    return CryptoBotRatesSource()
+
+
+# Глобальный кэш курсов активов к USD
+asset_rates_cache: RefreshingCache[Dict[str, float]] = RefreshingCache(
+    loader=_build_asset_rates_source(),
+    ttl=settings.ASSET_RATES_CACHE_TTL,
+    refresh_interval=settings.ASSET_RATES_REFRESH_INTERVAL,
+    default=STABLE_ASSET_RATES,
+    name="курсы активов",
+)
+
+
+def usd_to_asset(amount_usd: float, asset: str) -> float:
+    """Пересчитать сумму в USD в количество актива (поиск в словаре, без HTTP)"""
+    rate = asset_rates_cache.get().get(asset)
+    if not rate:
+        raise ValueError(f"Нет курса для {asset}")
+    return round(amount_usd / rate, ASSET_DECIMALS.get(asset, 8))
+
+
+def asset_to_usd(amount: float, asset: str) -> float:
+    """Пересчитать количество актива в USD"""
+    rate = asset_rates_cache.get().get(asset)
+    if not rate:
+        raise ValueError(f"Нет курса для {asset}")
+    return round(amount * rate, 2)
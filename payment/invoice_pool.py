@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, Optional, Set, Tuple
+
+from bot.keyboards import BET_AMOUNTS, BET_CURRENCIES
+from bot.metadata import bot_metadata
+from config import settings
+from payment.cryptobot import cryptobot
+from payment.exchange_rates import usd_to_asset
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, float]
+
+
+@dataclass
+class PooledInvoice:
+    """Заранее выставленный, ещё никому не выданный счёт"""
+    invoice: Dict
+    asset_amount: float  # сумма в активе по курсу на момент выставления
+    created_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+
+class InvoicePool:
+    """
+    Пул заранее созданных счетов CryptoBot для стандартных сумм ставок.
+
+    Для каждой пары (валюта, сумма в USD) держим от low_watermark до high_watermark
+    счетов. create_game_and_invoice забирает готовый счёт мгновенно, фоновая
+    задача доливает пул и утилизирует устаревшие счета. Нестандартные суммы
+    (и пустой пул) обслуживаются созданием счёта на лету.
+
+    Сумма счёта в активе зафиксирована по курсу на момент выставления, а ставка
+    и выплата считаются в USD: счёт, чья сумма разошлась с текущим курсом больше
+    чем на rate_tolerance, не выдаётся и утилизируется.
+    """
+
+    def __init__(self,
+                 assets: Iterable[str],
+                 amounts: Iterable[float],
+                 low_watermark: int = 1,
+                 high_watermark: int = 3,
+                 ttl: int = 1800,
+                 pay_window: int = 900,
+                 refill_interval: float = 30.0,
+                 concurrency: int = 4,
+                 rate_tolerance: float = 0.005):
+        self.assets = list(assets)
+        self.amounts = [float(a) for a in amounts]
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.ttl = ttl
+        self.pay_window = pay_window
+        self.refill_interval = refill_interval
+        self.concurrency = concurrency
+        self.rate_tolerance = rate_tolerance
+
+        self._pools: Dict[PoolKey, Deque[PooledInvoice]] = {
+            (asset, amount): deque() for asset in self.assets for amount in self.amounts
+        }
+        self._refill_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+
+        # Счётчики для мониторинга
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+        self.repriced = 0
+
+    # ---------- Выдача ----------
+
+    def claim(self, asset: str, amount: float) -> Optional[Dict]:
+        """Забрать готовый счёт из пула (без сетевых запросов) или None"""
+        key = (asset, float(amount))
+        pool = self._pools.get(key)
+        if pool is None:
+            return None
+
+        while pool:
+            item = pool.popleft()
+            if item.age < self.ttl and not self._is_repriced(item, asset, amount):
+                self.hits += 1
+                if len(pool) <= self.low_watermark:
+                    self._refill_event.set()
+                return item.invoice
+            self._schedule_recycle(item)
+
+        self.misses += 1
+        self._refill_event.set()
+        return None
+
+    def _is_repriced(self, item: PooledInvoice, asset: str, amount: float) -> bool:
+        """Курс актива ушёл дальше допуска: сумма счёта больше не соответствует ставке в USD"""
+        try:
+            current = usd_to_asset(amount, asset)
+        except ValueError:
+            # Без курса сумму не проверить — такой счёт не выдаём
+            return True
+        if current <= 0 or abs(item.asset_amount - current) / current <= self.rate_tolerance:
+            return False
+        self.repriced += 1
+        return True
+
+    def stats(self) -> dict:
+        """Состояние пула для мониторинга"""
+        return {
+            "sizes": {f"{asset}:{amount:g}": len(pool) for (asset, amount), pool in self._pools.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "recycled": self.recycled,
+            "repriced": self.repriced,
+        }
+
+    # ---------- Фоновое пополнение ----------
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._refill_event.set()
+            logger.info(
+                f"Пул счетов запущен: {len(self._pools)} ключей, "
+                f"low={self.low_watermark}, high={self.high_watermark}, ttl={self.ttl}s"
+            )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Невыданные счета больше не нужны — удаляем их в CryptoBot
+        items = [item for pool in self._pools.values() for item in pool]
+        for pool in self._pools.values():
+            pool.clear()
+        await asyncio.gather(*(self._recycle(item) for item in items), return_exceptions=True)
+        logger.info("Пул счетов остановлен")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._refill_event.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refill_event.clear()
+            try:
+                await self._refill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка пополнения пула счетов: {e}")
+
+    async def _refill(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        jobs = []
+
+        for (asset, amount), pool in self._pools.items():
+            # Утилизируем устаревшие счета и счета, разошедшиеся с текущим курсом
+            while pool and pool[0].age >= self.ttl:
+                self._schedule_recycle(pool.popleft())
+            for item in list(pool):
+                if self._is_repriced(item, asset, amount):
+                    pool.remove(item)
+                    self._schedule_recycle(item)
+
+            if len(pool) > self.low_watermark:
+                continue
+            for _ in range(self.high_watermark - len(pool)):
+                jobs.append(self._mint(semaphore, asset, amount, pool))
+
+        if jobs:
+            await asyncio.gather(*jobs)
+
+    async def _mint(self, semaphore: asyncio.Semaphore, asset: str, amount: float, pool: Deque[PooledInvoice]) -> None:
+        async with semaphore:
+            try:
+                asset_amount = usd_to_asset(amount, asset)
+                invoice = await cryptobot.create_invoice(
+                    asset=asset,
+                    amount=asset_amount,
+                    description="",
+                    paid_btn_url=bot_metadata.return_url,
+                    expires_in=self.ttl + self.pay_window
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось пополнить пул {asset}:{amount:g}: {e}")
+                return
+            pool.append(PooledInvoice(invoice, asset_amount))
+
+    def _schedule_recycle(self, item: PooledInvoice) -> None:
+        task = asyncio.create_task(self._recycle(item))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _recycle(self, item: PooledInvoice) -> None:
+        self.recycled += 1
+        invoice_id = item.invoice.get("invoice_id")
+        if invoice_id is None:
+            return
+        try:
+            await cryptobot.delete_invoice(invoice_id)
+        except Exception as e:
+            logger.debug(f"Не удалось удалить устаревший счёт {invoice_id}: {e}")
+
+
+# Глобальный экземпляр пула
+invoice_pool = InvoicePool(
+    assets=BET_CURRENCIES,
+    amounts=BET_AMOUNTS,
+    low_watermark=settings.INVOICE_POOL_LOW_WATERMARK,
+    high_watermark=settings.INVOICE_POOL_HIGH_WATERMARK,
+    ttl=settings.INVOICE_POOL_TTL,
+    pay_window=settings.INVOICE_POOL_PAY_WINDOW,
+    refill_interval=settings.INVOICE_POOL_REFILL_INTERVAL,
+    concurrency=settings.INVOICE_POOL_CONCURRENCY,
+    rate_tolerance=settings.INVOICE_POOL_RATE_TOLERANCE,
+)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+from typing import Optional, Set
+
+from config import settings
+from database.crud import OutboxCRUD
+from database.database import async_session_maker
+from payment.payouts import payout_queue, PayoutJob, SuccessHandler, FailureHandler
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """
+    Ретранслятор outbox выплат.
+
+    Завершение игры и запись в payout_outbox фиксируются одним коммитом,
+    а relay забирает записи пачками (с арендой locked_until), отдаёт их
+    в очередь выплат и отмечает DONE/FAILED по результату. Перед createCheck
+    запись переводится в ISSUING: повторно захватываются только записи,
+    до отправки которых дело не дошло, а ISSUING с истёкшей арендой
+    (чек мог быть создан) уходят в FAILED на ручную сверку.
+    """
+
+    def __init__(self,
+                 batch_size: int = 50,
+                 poll_interval: float = 1.0,
+                 lease_seconds: float = 300.0,
+                 max_in_flight: int = 200):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_in_flight = max_in_flight
+
+        self._in_flight: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._on_delivered: Optional[SuccessHandler] = None
+        self._on_failed: Optional[FailureHandler] = None
+
+        # Счётчики для мониторинга
+        self.claimed = 0
+        self.done = 0
+        self.failed = 0
+        self.stuck = 0
+
+    def set_handlers(self, on_delivered: SuccessHandler, on_failed: FailureHandler) -> None:
+        """Колбэки уведомления пользователя после обработки выплаты"""
+        self._on_delivered = on_delivered
+        self._on_failed = on_failed
+
+    def notify(self) -> None:
+        """Разбудить relay сразу после коммита новой выплаты"""
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "claimed": self.claimed,
+            "done": self.done,
+            "failed": self.failed,
+            "stuck": self.stuck,
+        }
+
+    async def start(self) -> None:
+        if self._task is None:
+            payout_queue.set_handlers(
+                on_success=self._on_check_created,
+                on_failure=self._on_check_failed,
+                on_send=self._on_issuing
+            )
+            self._task = asyncio.create_task(self._run())
+            self._wakeup.set()
+            logger.info(f"Outbox relay запущен: пачка {self.batch_size}, аренда {self.lease_seconds}s")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка outbox relay: {e}")
+
+    async def _drain(self) -> None:
+        async with async_session_maker() as session:
+            stuck = await OutboxCRUD.fail_stuck_issuing(session)
+        if stuck:
+            self.stuck += len(stuck)
+            logger.error(f"Выплаты зависли в ISSUING, нужна ручная сверка: outbox_id={stuck}")
+
+        while len(self._in_flight) < self.max_in_flight:
+            limit = min(self.batch_size, self.max_in_flight - len(self._in_flight))
+            async with async_session_maker() as session:
+                entries = await OutboxCRUD.claim_batch(session, limit, self.lease_seconds)
+            if not entries:
+                return
+
+            for entry in entries:
+                if entry.id in self._in_flight:
+                    continue
+                self._in_flight.add(entry.id)
+                self.claimed += 1
+                payout_queue.submit(PayoutJob(
+                    user_telegram_id=entry.user_telegram_id,
+                    game_id=str(entry.game_id),
+                    asset=entry.asset,
+                    amount=entry.amount,
+                    outbox_id=entry.id
+                ))
+
+            if len(entries) < limit:
+                return
+
+    async def _on_issuing(self, job: PayoutJob) -> bool:
+        if job.outbox_id is None:
+            return True
+        try:
+            async with async_session_maker() as session:
+                issued = await OutboxCRUD.mark_issuing(session, job.outbox_id, self.lease_seconds)
+        except Exception as e:
+            # Запись осталась PROCESSING и будет захвачена повторно после аренды
+            logger.error(f"Не удалось зафиксировать отправку выплаты {job.outbox_id}: {e}")
+            issued = False
+        if not issued:
+            self._in_flight.discard(job.outbox_id)
+        return issued
+
+    async def _on_check_created(self, job: PayoutJob, check_url: str) -> None:
+        if job.outbox_id is not None:
+            try:
+                async with async_session_maker() as session:
+                    await OutboxCRUD.mark_done(session, job.outbox_id, check_url)
+            finally:
+                self._in_flight.discard(job.outbox_id)
+        self.done += 1
+        if self._on_delivered:
+            await self._on_delivered(job, check_url)
+
+    async def _on_check_failed(self, job: PayoutJob, error: Exception) -> None:
+        if job.outbox_id is not None:
+            try:
+                async with async_session_maker() as session:
+                    await OutboxCRUD.mark_failed(session, job.outbox_id, str(error))
+            finally:
+                self._in_flight.discard(job.outbox_id)
+        self.failed += 1
+        if self._on_failed:
+            await self._on_failed(job, error)
+
+
+# Глобальный экземпляр relay
+outbox_relay = OutboxRelay(
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+    max_in_flight=settings.OUTBOX_MAX_IN_FLIGHT,
+)
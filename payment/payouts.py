@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+
+import aiohttp
+
+from config import settings
+from payment.cryptobot import cryptobot, CryptoBotError
+from payment.exchange_rates import usd_to_asset
+from payment.resilience import CircuitOpenError
+from utils.rate_limit import TokenBucket
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PayoutJob:
+    """Задание на выплату выигрыша чеком (amount — в USD)"""
+    user_telegram_id: int
+    game_id: str
+    asset: str
+    amount: float
+    outbox_id: Optional[int] = None
+    attempts: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+
+
+SuccessHandler = Callable[[PayoutJob, str], Awaitable[None]]
+FailureHandler = Callable[[PayoutJob, Exception], Awaitable[None]]
+SendHandler = Callable[[PayoutJob], Awaitable[bool]]
+
+
+class PayoutQueue:
+    """
+    Очередь выплат: выигрыши ставятся в очередь и обрабатываются
+    ограниченным пулом воркеров. Запросы к createCheck проходят через
+    token bucket под лимиты CryptoBot. createCheck не идемпотентен, поэтому
+    повторяются только сбои, при которых запрос точно не дошёл до CryptoBot
+    (нет соединения/DNS, открыт предохранитель, 429). Неоднозначные ошибки
+    (таймаут, обрыв, 5xx) не повторяются — выплата уходит в on_failure
+    на ручную проверку. Перед первым запросом вызывается on_send: False —
+    выплату не отправлять. Готовый чек отдаётся on_success.
+    """
+
+    def __init__(self,
+                 workers: int = 4,
+                 rate: float = 3.0,
+                 burst: int = 5,
+                 max_attempts: int = 5,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 30.0):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = TokenBucket(rate, burst)
+
+        self._queue: "asyncio.Queue[PayoutJob]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._on_success: Optional[SuccessHandler] = None
+        self._on_failure: Optional[FailureHandler] = None
+        self._on_send: Optional[SendHandler] = None
+
+        # Счётчики для мониторинга
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+
+    def set_handlers(self, on_success: SuccessHandler, on_failure: FailureHandler,
+                     on_send: Optional[SendHandler] = None) -> None:
+        """Колбэки доставки результата пользователю и фиксации отправки"""
+        self._on_success = on_success
+        self._on_failure = on_failure
+        self._on_send = on_send
+
+    def submit(self, job: PayoutJob) -> None:
+        """Поставить выплату в очередь (не ждёт CryptoBot)"""
+        self._queue.put_nowait(job)
+        logger.info(f"Выплата поставлена в очередь: game_id={job.game_id}, {job.amount} USD в {job.asset}")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+            logger.info(f"Очередь выплат запущена: {self.workers} воркеров")
+
+    async def stop(self, timeout: Optional[float] = 30.0) -> None:
+        """
+        Дождаться уже принятых выплат (не дольше timeout), затем остановить воркеры.
+        Отмена посреди createCheck оставляет запись в ISSUING до ручной сверки,
+        поэтому воркеры не прерываются сразу.
+        """
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь выплат: не дождались {self._queue.qsize()} заданий при остановке")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if not self._queue.empty():
+            logger.warning(f"Очередь выплат остановлена, необработанных заданий: {self._queue.qsize()}")
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """Повторяем, только если чек гарантированно не был создан"""
+        if isinstance(error, CryptoBotError):
+            return error.code == 429
+        # ClientConnectorError — соединение не установлено (отказ, DNS, TLS): запрос не отправлен
+        return isinstance(error, (aiohttp.ClientConnectorError, CircuitOpenError))
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера выплат #{index}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: PayoutJob) -> None:
+        if self._on_send and not await self._on_send(job):
+            logger.warning(f"Выплата game_id={job.game_id} пропущена: отправка не подтверждена")
+            return
+        while True:
+            job.attempts += 1
+            await self.limiter.acquire()
+            try:
+                check = await cryptobot.create_check(
+                    asset=job.asset,
+                    amount=usd_to_asset(job.amount, job.asset)
+                )
+                check_url = check.get('bot_check_url') or check.get('url')
+                if not check_url:
+                    raise ValueError("URL чека не получен")
+            except Exception as e:
+                if self._is_retryable(e) and job.attempts < self.max_attempts:
+                    self.retries += 1
+                    delay = self._backoff(job.attempts)
+                    logger.warning(
+                        f"Повтор выплаты game_id={job.game_id} через {delay:.1f}s "
+                        f"(попытка {job.attempts}): {e}"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+
+                self.failed += 1
+                logger.error(f"Выплата game_id={job.game_id} не удалась: {e}")
+                if self._on_failure:
+                    await self._on_failure(job, e)
+                return
+
+            self.completed += 1
+            logger.info(
+                f"Чек создан: game_id={job.game_id}, {job.amount} USD в {job.asset}, "
+                f"за {time.monotonic() - job.created_at:.2f}s"
+            )
+            if self._on_success:
+                await self._on_success(job, check_url)
+            return
+
+
+# Глобальный экземпляр очереди выплат
+payout_queue = PayoutQueue(
+    workers=settings.PAYOUT_WORKERS,
+    rate=settings.PAYOUT_RATE_LIMIT,
+    burst=settings.PAYOUT_RATE_BURST,
+    max_attempts=settings.PAYOUT_MAX_ATTEMPTS,
+)
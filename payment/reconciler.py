@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from config import settings
+from database.crud import TransactionCRUD
+from database.database import async_session_maker
+from database.models import TransactionStatus
+from payment.cryptobot import cryptobot
+from payment.webhook import payment_queue, process_payment, processed_invoices
+from utils.work_queue import QueueFullError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class InvoiceReconciler:
+    """
+    Фоновая сверка счетов с CryptoBot.
+
+    Раз в interval секунд берёт все PENDING-транзакции из БД и запрашивает
+    их статусы пачками через getInvoices(invoice_ids=...). Оплаченные счета
+    ставятся в payment_queue (process_payment, как из webhook), истёкшие
+    помечаются EXPIRED. Так пропущенный webhook восстанавливается за один цикл,
+    а один запрос покрывает batch_size счетов.
+    """
+
+    def __init__(self, interval: float = 5.0, batch_size: int = 100, lookback_hours: int = 24):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lookback = timedelta(hours=lookback_hours)
+        self._task: Optional[asyncio.Task] = None
+        # Счета, поставленные в payment_queue и ещё не обработанные
+        self._queued: Set[str] = set()
+
+        # Счётчики для мониторинга
+        self.cycles = 0
+        self.api_calls = 0
+        self.recovered = 0
+        self.expired = 0
+
+    def stats(self) -> dict:
+        return {
+            "cycles": self.cycles,
+            "api_calls": self.api_calls,
+            "recovered": self.recovered,
+            "expired": self.expired,
+            "queued": len(self._queued),
+        }
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Сверка счетов запущена: каждые {self.interval}s, пачка {self.batch_size}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка сверки счетов: {e}")
+
+    async def reconcile(self) -> None:
+        """Один цикл сверки"""
+        self.cycles += 1
+        async with async_session_maker() as session:
+            invoice_ids = await TransactionCRUD.get_pending_invoice_ids(
+                session, since=datetime.utcnow() - self.lookback
+            )
+        if not invoice_ids:
+            return
+
+        for i in range(0, len(invoice_ids), self.batch_size):
+            await self._reconcile_batch(invoice_ids[i:i + self.batch_size])
+
+    async def _reconcile_batch(self, invoice_ids: List[str]) -> None:
+        self.api_calls += 1
+        response = await cryptobot.get_invoices(invoice_ids=invoice_ids, count=len(invoice_ids))
+
+        for invoice in response.get("items", []):
+            status = invoice.get("status")
+            if status == "paid":
+                invoice_id = str(invoice.get("invoice_id"))
+                # Уже в очереди или в обработке (webhook, прошлый цикл) — не дублируем
+                if invoice_id in self._queued or invoice_id in processed_invoices:
+                    continue
+                try:
+                    payment_queue.submit(self._settle, invoice)
+                except QueueFullError as e:
+                    # Счёт останется PENDING и попадёт в следующий цикл сверки
+                    logger.warning(f"Сверка: {e}, счёт {invoice.get('invoice_id')} отложен")
+                    continue
+                self._queued.add(invoice_id)
+                self.recovered += 1
+                logger.info(f"Сверка: счёт {invoice.get('invoice_id')} оплачен, поставлен в обработку")
+            elif status == "expired":
+                await self._mark_expired(str(invoice.get("invoice_id")))
+
+    async def _settle(self, invoice: dict) -> None:
+        try:
+            await process_payment(invoice)
+        finally:
+            self._queued.discard(str(invoice.get("invoice_id")))
+
+    async def _mark_expired(self, invoice_id: str) -> None:
+        async with async_session_maker() as session:
+            tx = await TransactionCRUD.get_by_invoice_id(session, invoice_id)
+            if tx and tx.status == TransactionStatus.PENDING:
+                await TransactionCRUD.update_status(session, tx, TransactionStatus.EXPIRED)
+                self.expired += 1
+
+
+# Глобальный экземпляр сверки
+invoice_reconciler = InvoiceReconciler(
+    interval=settings.RECONCILE_INTERVAL,
+    batch_size=settings.RECONCILE_BATCH_SIZE,
+    lookback_hours=settings.RECONCILE_LOOKBACK_HOURS,
+)
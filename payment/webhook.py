@@ -1,14 +1,25 @@
-from fastapi import FastAPI, Request, BackgroundTasks
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import asyncio
+import hashlib
+import hmac
 import json
+import time
 import traceback
 import logging
-import aiohttp
 
 from database.database import async_session_maker
-from database.crud import TransactionCRUD, GameCRUD
+from database.crud import TransactionCRUD, GameCRUD, OutboxCRUD
 from database.models import GameResult, User, Game, TransactionStatus
-from payment.cryptobot import cryptobot
+from payment.payouts import PayoutJob
+from payment.outbox_relay import outbox_relay
+from bot.update_dispatcher import update_dispatcher
+from bot.outbound import outbound_priority, PRIORITY_RESULT
+from payment.cryptobot import CryptoBotAPI
 from config import settings
+from payment.exchange_rates import usd_rub_cache
+from utils.lru import LRUCache
+from utils.work_queue import WorkQueue, QueueFullError
 from aiogram import Dispatcher
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
@@ -19,6 +30,49 @@ logger = logging.getLogger(__name__)
 bot = None
 dp = None
 
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (передаётся в set_webhook)
+TELEGRAM_SECRET_TOKEN = settings.TELEGRAM_WEBHOOK_SECRET or hashlib.sha256(settings.BOT_TOKEN.encode()).hexdigest()
+
+# Счётчики входящего трафика
+ingress_stats = {
+    "accepted_cryptobot": 0,
+    "accepted_telegram": 0,
+    "rejected_signature": 0,
+    "rejected_secret": 0,
+    "rejected_unauthenticated": 0,
+    "rejected_json": 0,
+}
+
+# Недавно обработанные и обрабатываемые счета (дедупликация платежей)
+processed_invoices = LRUCache(maxsize=settings.PAYMENT_DEDUPE_SIZE)
+
+# Очередь обработки оплаченных счетов (вместо BackgroundTasks)
+payment_queue = WorkQueue(
+    "payments",
+    workers=settings.PAYMENT_QUEUE_WORKERS,
+    max_depth=settings.PAYMENT_QUEUE_MAX_DEPTH,
+)
+
+# Счётчики обработки платежей
+payment_stats = {
+    "settled": 0,
+    "duplicates_dropped": 0,
+    "already_settled": 0,
+    # Время от начала обработки оплаты до сообщения с результатом. Только инструментирование:
+    # замеров «до/после» конвейера нет — сравнивать прогоном на loadtest.fake_cryptobot/fake_telegram
+    "results_delivered": 0,
+    "result_latency_avg_ms": 0.0,
+    "result_latency_max_ms": 0.0,
+}
+
+# Анимация Dice длится несколько секунд: результат показываем не раньше её окончания.
+# game.id -> (начало обработки оплаты, момент показа результата)
+result_timings = LRUCache(maxsize=10000, ttl=600)
+_reveal_tasks = set()
+
+# Выигрыши больше этой суммы (USD) выплачиваются администраторами вручную
+MAX_AUTO_PAYOUT = 100
+
 # Определение описаний игр
 GAME_DESCRIPTIONS = {
     "dice_high": {"emoji": "🎲", "name": "Больше (4-5-6)", "coef": "1.8x"},
@@ -55,25 +109,43 @@ def set_webhook_dispatcher(dispatcher):
 # --- Регистрация эндпоинтов ---
 def setup_webhooks(app: FastAPI):
     @app.post(settings.WEBHOOK_PATH)
-    async def telegram_webhook(request: Request, background_tasks: BackgroundTasks):
+    async def telegram_webhook(request: Request):
         body = await request.body()
-        logger.info(f"Получен запрос webhook: {body.decode('utf-8')}")
+
+        # Аутентификация по сырым байтам — до разбора JSON и обращений к БД
+        source = authenticate_ingress(request.headers, body)
+        if source is None:
+            return JSONResponse({"ok": False}, status_code=401)
+
         try:
             data = json.loads(body)
+        except json.JSONDecodeError as e:
+            ingress_stats["rejected_json"] += 1
+            logger.error(f"Ошибка декодирования JSON: {e}")
+            return JSONResponse({"error": "Invalid JSON"}, status_code=400)
 
-            if data.get("update_type") == "invoice_paid":
-                payload = data.get("payload", {})
-                background_tasks.add_task(process_payment, payload)
+        logger.debug(f"Получен запрос webhook ({source}): {data}")
+        try:
+            if source == "cryptobot":
+                if data.get("update_type") == "invoice_paid":
+                    payload = data.get("payload", {})
+                    try:
+                        payment_queue.submit(process_payment, payload)
+                    except QueueFullError as e:
+                        # CryptoBot повторит доставку webhook позже
+                        logger.warning(f"{e} — платёж отклонён с 503")
+                        return JSONResponse({"ok": False}, status_code=503)
 
             elif bot and dp:
-                await dp.feed_raw_update(bot, data)
-                logger.info("Обновление передано в роутеры для обработки")
+                # Ответ Telegram отдаём сразу, обработка — в шарде пользователя
+                try:
+                    update_dispatcher.submit(data)
+                except QueueFullError as e:
+                    logger.warning(f"{e} — обновление отклонено с 503")
+                    return JSONResponse({"ok": False}, status_code=503)
             else:
                 logger.warning("Обновление не обработано: bot или dp не инициализированы")
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка декодирования JSON: {e}")
-            return {"error": "Invalid JSON"}, 400
         except Exception as e:
             logger.error(f"Ошибка в webhook: {e}")
             traceback.print_exc()
@@ -82,40 +154,66 @@ def setup_webhooks(app: FastAPI):
     logger.info("Webhook endpoints registered")
 
 
+def authenticate_ingress(headers, body: bytes):
+    """
+    Определить источник запроса по заголовкам и сырому телу.
+    Возвращает "cryptobot", "telegram" или None (запрос отклонён).
+    """
+    signature = headers.get("crypto-pay-api-signature")
+    if signature is not None:
+        if CryptoBotAPI.verify_signature(body, signature, settings.cryptobot_token):
+            ingress_stats["accepted_cryptobot"] += 1
+            return "cryptobot"
+        ingress_stats["rejected_signature"] += 1
+        logger.warning("Отклонён webhook CryptoBot с неверной подписью")
+        return None
+
+    secret = headers.get("x-telegram-bot-api-secret-token")
+    if secret is not None:
+        if hmac.compare_digest(secret, TELEGRAM_SECRET_TOKEN):
+            ingress_stats["accepted_telegram"] += 1
+            return "telegram"
+        ingress_stats["rejected_secret"] += 1
+        logger.warning("Отклонён запрос с неверным X-Telegram-Bot-Api-Secret-Token")
+        return None
+
+    ingress_stats["rejected_unauthenticated"] += 1
+    return None
+
+
 async def get_usd_to_rub_rate():
-    """Получает текущий курс USD -> RUB через API"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get('https://api.exchangerate-api.com/v4/latest/USD', timeout=5) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data.get('rates', {}).get('RUB', 82.0)
-    except Exception as e:
-        logger.error(f"Ошибка получения курса USD/RUB: {e}")
-    return 82.0
+    """Текущий курс USD -> RUB из кэша (без сетевого запроса на горячем пути)"""
+    return usd_rub_cache.get()
 
 
 # --- Обработка платежа ---
 async def process_payment(payload: dict):
+    invoice_id = payload.get("invoice_id") or payload.get("id")
+    if not invoice_id:
+        logger.error("invoice_id не найден")
+        return
+    invoice_id = str(invoice_id)
+
+    # Повторы webhook, сверка и кнопка "проверить оплату" приходят с одним invoice_id:
+    # дубликаты отбрасываются без обращения к БД
+    if not processed_invoices.add(invoice_id):
+        payment_stats["duplicates_dropped"] += 1
+        logger.info(f"Дубликат платежа отброшен: invoice={invoice_id}")
+        return
+
     logger.info(f"Начало обработки платежа: {payload}")
+    settle_started = time.monotonic()
+    transitioned = False
     try:
-        invoice_id = payload.get("invoice_id") or payload.get("id")
-        if not invoice_id:
-            logger.error("invoice_id не найден")
-            return
-
         async with async_session_maker() as session:
-            tx = await TransactionCRUD.get_by_invoice_id(session, str(invoice_id))
+            # Атомарный переход PENDING -> PAID: выигрывает ровно один обработчик
+            tx = await TransactionCRUD.mark_paid_if_pending(session, invoice_id)
+            transitioned = True
             if not tx:
-                logger.error(f"Транзакция не найдена: {invoice_id}")
-                return
-
-            if tx.status != TransactionStatus.PENDING:
-                logger.warning(f"Транзакция не в статусе PENDING, invoice={invoice_id}")
+                payment_stats["already_settled"] += 1
+                logger.warning(f"Транзакция не найдена или уже не в статусе PENDING, invoice={invoice_id}")
                 return
 
-            await TransactionCRUD.update_status(session, tx, TransactionStatus.PAID)
-
             game = await session.get(Game, tx.game_id)
             if not game:
                 logger.error(f"Игра не найдена для транзакции {invoice_id}")
@@ -126,15 +224,70 @@ async def process_payment(payload: dict):
                 logger.error(f"Пользователь не найден для игры {game.game_id}")
                 return
 
-            await send_dice_and_wait_result(user.telegram_id, game, tx, session)
+            payment_stats["settled"] += 1
+            # Результат игры обгоняет в очереди исходящих правки меню
+            with outbound_priority(PRIORITY_RESULT):
+                await send_dice_and_wait_result(user.telegram_id, game, tx, session, settle_started)
 
     except Exception as exc:
+        # Переход не удался (например, БД недоступна) — разрешаем повторную обработку
+        if not transitioned:
+            processed_invoices.pop(invoice_id)
         logger.error(f"Исключение в process_payment: {exc}")
         traceback.print_exc()
 
 
 # --- Логика игры ---
-async def send_dice_and_wait_result(user_telegram_id: int, game: Game, tx, session):
+def schedule_reveal(game_key: str, coro) -> None:
+    """
+    Отправить результат после окончания анимации Dice, не занимая воркер:
+    отправка выполняется отдельной задачей, которая ждёт момента показа.
+    """
+    async def reveal():
+        timing = result_timings.get(game_key)
+        if timing:
+            delay = timing[1] - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        try:
+            await coro
+        except Exception as exc:
+            logger.error(f"Ошибка отправки результата игры {game_key}: {exc}")
+            return
+        record_result_latency(game_key)
+
+    task = asyncio.create_task(reveal())
+    _reveal_tasks.add(task)
+    task.add_done_callback(_reveal_tasks.discard)
+
+
+async def drain_reveals(timeout: float) -> None:
+    """Остановка: дождаться отложенных сообщений с результатами (не дольше timeout)"""
+    if not _reveal_tasks:
+        return
+    _, pending = await asyncio.wait(set(_reveal_tasks), timeout=timeout)
+    if pending:
+        logger.warning(f"Не дождались отправки результатов игр при остановке: {len(pending)}")
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def record_result_latency(game_key: str) -> None:
+    timing = result_timings.pop(game_key)
+    if not timing:
+        return
+    latency_ms = (time.monotonic() - timing[0]) * 1000
+    delivered = payment_stats["results_delivered"] + 1
+    payment_stats["results_delivered"] = delivered
+    payment_stats["result_latency_avg_ms"] = round(
+        payment_stats["result_latency_avg_ms"] + (latency_ms - payment_stats["result_latency_avg_ms"]) / delivered, 1
+    )
+    payment_stats["result_latency_max_ms"] = round(max(payment_stats["result_latency_max_ms"], latency_ms), 1)
+
+
+async def send_dice_and_wait_result(user_telegram_id: int, game: Game, tx, session,
+                                    settle_started: float = None):
     if bot is None:
         logger.error("Экземпляр бота не установлен")
         return
@@ -149,13 +302,26 @@ async def send_dice_and_wait_result(user_telegram_id: int, game: Game, tx, sessi
 
     game_type = (game.game_type or "").split("_")[0]
     emoji = emoji_map.get(game_type, "🎲")
+    game_key = str(game.id)
+
+    play_again_kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🎮 Играть снова", callback_data="back_to_games")]
+    ])
 
     try:
-        await bot.send_message(user_telegram_id, "🔥Ставка принята! Игра уже запущена...", parse_mode="HTML")
+        # Объявление и бросок уходят параллельно: значение Dice нужно как можно раньше
+        announce = asyncio.create_task(
+            bot.send_message(user_telegram_id, "🔥Ставка принята! Игра уже запущена...", parse_mode="HTML")
+        )
         dice_message = await bot.send_dice(chat_id=user_telegram_id, emoji=emoji)
         dice_value = dice_message.dice.value if dice_message and dice_message.dice else None
+        result_timings.set(game_key, (
+            settle_started or time.monotonic(),
+            time.monotonic() + settings.DICE_ANIMATION_SECONDS,
+        ))
 
         if dice_value is None:
+            await announce
             logger.error(f"Не удалось получить значение Dice для игры {game.game_id}")
             await bot.send_message(user_telegram_id, "❌ Ошибка при броске кубика.", parse_mode="HTML")
             return
@@ -170,17 +336,20 @@ async def send_dice_and_wait_result(user_telegram_id: int, game: Game, tx, sessi
 
         result_enum = GameResult.WIN if win else GameResult.LOSS
 
+        # Пока идёт анимация: результат и выплата в outbox пишутся одним коммитом,
+        # после чего relay сразу начинает создавать чек
+        if 0 < payout <= MAX_AUTO_PAYOUT:
+            OutboxCRUD.add_payout(session, game, user_telegram_id, game.currency, payout)
+
         await GameCRUD.complete_game(session, game, result_enum, payout)
         logger.info(f"Игра завершена: game_id={game.game_id}, result={result_enum}, payout={payout}")
 
-        game_info = GAME_DESCRIPTIONS.get(game.game_type, {'emoji': '🎮', 'name': game.game_type, 'coef': '?'})
+        if 0 < payout <= MAX_AUTO_PAYOUT:
+            outbox_relay.notify()
 
-        # === Подготовка клавиатуры с кнопкой "Играть снова" ===
-        play_again_kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎮 Играть снова", callback_data="back_to_games")]
-        ])
+        await announce
 
-        if payout > 100:  # Крупный выигрыш — ручная выплата
+        if payout > MAX_AUTO_PAYOUT:  # Крупный выигрыш — ручная выплата
             usd_to_rub = await get_usd_to_rub_rate()
             payout_rub = payout * usd_to_rub
             text = (
@@ -189,55 +358,25 @@ async def send_dice_and_wait_result(user_telegram_id: int, game: Game, tx, sessi
                 f"🚀 Удачи в следующих ставках!\n\n"
                 f"Тех.поддержка: @yoursupport</blockquote>"
             )
-            await bot.send_message(user_telegram_id, text, reply_markup=play_again_kb, parse_mode="HTML")
+            schedule_reveal(game_key, bot.send_message(
+                user_telegram_id, text, reply_markup=play_again_kb, parse_mode="HTML"
+            ))
             logger.warning(f"Крупный выигрыш ({payout} USD) у пользователя {user_telegram_id}")
             return
 
-        # --- Выплата через чек ---
-        if payout > 0:
-            try:
-                check_result = await cryptobot.create_check(asset=game.currency, amount=payout)
-                check_url = check_result.get('bot_check_url') or check_result.get('url')
-                if not check_url:
-                    raise ValueError("URL чека не получен")
-
-                usd_to_rub = await get_usd_to_rub_rate()
-                payout_rub = payout * usd_to_rub
-
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="💰 Получить выигрыш", url=check_url)],
-                    [InlineKeyboardButton(text="🎮 Играть снова", callback_data="back_to_games")]
-                ])
-
-                text = (
-                    f"🎉 <b>Победа! Твой выигрыш {payout:.2f} USD ({payout_rub:.2f} RUB)!</b>\n\n"
-                    f"<blockquote>💸 Удача на твоей стороне — не сбавляй обороты!\n"
-                    f"🚀 Следующие победы уже ждут тебя!</blockquote>\n\n"
-                    f"Получи свой выигрыш по кнопке ниже:"
-                )
-                await bot.send_message(user_telegram_id, text, reply_markup=keyboard, parse_mode="HTML")
-
-            except Exception as e:
-                logger.error(f"Ошибка при создании чека: {e}")
-                await bot.send_message(
-                    user_telegram_id,
-                    f"❌ Ошибка при создании чека выплаты: {e}",
-                    reply_markup=play_again_kb,
-                    parse_mode="HTML"
-                )
-        else:
+        # --- Выплату чеком создаёт outbox relay, сообщение о победе отправит deliver_payout ---
+        if payout <= 0:
             # Проигрыш
             text = (
                 f"🍀Удача на твоей стороне — просто нужно ещё несколько попыток!"
             )
-            await bot.send_message(user_telegram_id, text, reply_markup=play_again_kb, parse_mode="HTML")
+            schedule_reveal(game_key, bot.send_message(
+                user_telegram_id, text, reply_markup=play_again_kb, parse_mode="HTML"
+            ))
 
     except Exception as exc:
         logger.error(f"Ошибка в send_dice_and_wait_result: {exc}")
         traceback.print_exc()
-        play_again_kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎮 Играть снова", callback_data="back_to_games")]
-        ])
         await bot.send_message(
             user_telegram_id,
             f"❌ Ошибка обработки игры: {exc}",
@@ -246,6 +385,52 @@ async def send_dice_and_wait_result(user_telegram_id: int, game: Game, tx, sessi
         )
 
 
+# --- Доставка выплат ---
+async def deliver_payout(job: PayoutJob, check_url: str):
+    """Отправить пользователю сообщение о победе с готовым чеком"""
+    if bot is None:
+        logger.error("Экземпляр бота не установлен")
+        return
+
+    usd_to_rub = await get_usd_to_rub_rate()
+    payout_rub = job.amount * usd_to_rub
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="💰 Получить выигрыш", url=check_url)],
+        [InlineKeyboardButton(text="🎮 Играть снова", callback_data="back_to_games")]
+    ])
+
+    text = (
+        f"🎉 <b>Победа! Твой выигрыш {job.amount:.2f} USD ({payout_rub:.2f} RUB)!</b>\n\n"
+        f"<blockquote>💸 Удача на твоей стороне — не сбавляй обороты!\n"
+        f"🚀 Следующие победы уже ждут тебя!</blockquote>\n\n"
+        f"Получи свой выигрыш по кнопке ниже:"
+    )
+    # Чек может быть готов раньше, чем закончится анимация Dice
+    with outbound_priority(PRIORITY_RESULT):
+        schedule_reveal(job.game_id, bot.send_message(
+            job.user_telegram_id, text, reply_markup=keyboard, parse_mode="HTML"
+        ))
+
+
+async def notify_payout_failed(job: PayoutJob, error: Exception):
+    """Сообщить пользователю, что чек создать не удалось"""
+    if bot is None:
+        logger.error("Экземпляр бота не установлен")
+        return
+
+    play_again_kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🎮 Играть снова", callback_data="back_to_games")]
+    ])
+    with outbound_priority(PRIORITY_RESULT):
+        await bot.send_message(
+            job.user_telegram_id,
+            f"❌ Ошибка при создании чека выплаты: {error}",
+            reply_markup=play_again_kb,
+            parse_mode="HTML"
+        )
+
+
 # --- Результаты ---
 def evaluate_game_result(game_type: str, dice_value: int):
     if dice_value is None:
@@ -0,0 +1,77 @@
+import aiohttp
+import logging
+from typing import Optional
+
+from config import settings
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+
+class HTTPClient:
+    """
+    Общий HTTP-клиент для всех исходящих запросов (CryptoBot, курсы валют).
+    Одна aiohttp-сессия на всё приложение: keep-alive пул соединений,
+    кэш DNS, лимиты соединений на хост и настраиваемые таймауты.
+    """
+
+    def __init__(self,
+                 limit: int = 100,
+                 limit_per_host: int = 20,
+                 dns_cache_ttl: int = 300,
+                 keepalive_timeout: float = 30.0,
+                 total_timeout: float = 10.0,
+                 connect_timeout: float = 3.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def start(self) -> None:
+        """Создать сессию (вызывается из lifespan при старте)"""
+        if self._session is not None and not self._session.closed:
+            return
+        self._session = self._create_session()
+        logger.info(
+            f"HTTP-клиент запущен: limit={self.limit}, limit_per_host={self.limit_per_host}, "
+            f"dns_ttl={self.dns_cache_ttl}s"
+        )
+
+    async def close(self) -> None:
+        """Закрыть сессию и все соединения пула"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP-клиент остановлен")
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Текущая сессия. Если lifespan ещё не запускал клиент
+        (скрипты, тесты) — сессия создаётся лениво.
+        """
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+
+# Глобальный экземпляр клиента
+http_client = HTTPClient(
+    limit=settings.HTTP_POOL_LIMIT,
+    limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+    dns_cache_ttl=settings.HTTP_DNS_CACHE_TTL,
+    keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+    total_timeout=settings.HTTP_TIMEOUT,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class RefreshingCache(Generic[T]):
+    """
+    Кэш одного значения с фоновым обновлением.
+
+    - get() никогда не ходит в сеть: отдаёт последнее удачное значение
+      (или default), даже если оно устарело (stale-while-revalidate);
+    - устаревшее значение запускает обновление в фоне;
+    - одновременные промахи схлопываются в один запрос (singleflight);
+    - фоновая задача обновляет значение каждые refresh_interval секунд.
+    """
+
+    def __init__(self,
+                 loader: Callable[[], Awaitable[T]],
+                 ttl: float,
+                 refresh_interval: Optional[float] = None,
+                 default: Optional[T] = None,
+                 name: str = "cache"):
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval or ttl
+        self.default = default
+        self.name = name
+
+        self._value: Optional[T] = None
+        self._loaded_at: Optional[float] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Счётчики для мониторинга
+        self.refreshes = 0
+        self.errors = 0
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    def get(self) -> Optional[T]:
+        """Мгновенно вернуть значение; при устаревании — обновить в фоне"""
+        if self.is_stale:
+            self.refresh()
+        return self._value if self._value is not None else self.default
+
+    async def get_fresh(self) -> Optional[T]:
+        """Дождаться значения, если его ещё нет (прогрев при старте)"""
+        if self._value is None:
+            await self.refresh()
+        return self.get()
+
+    def refresh(self) -> "asyncio.Task":
+        """Запустить обновление; параллельные вызовы получают один и тот же запрос"""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._load())
+        return self._inflight
+
+    async def _load(self) -> None:
+        try:
+            value = await self.loader()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Не удалось обновить {self.name}, используем последнее значение: {e}")
+            return
+        self._value = value
+        self._loaded_at = time.monotonic()
+        self.refreshes += 1
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self.get_fresh()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
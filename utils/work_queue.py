@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+Job = Tuple[float, Callable[..., Awaitable[Any]], tuple]
+
+
+class QueueFullError(Exception):
+    """Очередь заполнена — вызывающая сторона должна ответить 503 / повторить позже"""
+
+
+class WorkQueue:
+    """
+    Внутрипроцессная очередь задач с фиксированным числом воркеров.
+
+    - max_depth ограничивает число ожидающих задач (backpressure);
+    - считает глубину очереди и время ожидания задачи до начала выполнения;
+    - stop() дожидается выполнения уже принятых задач (graceful drain).
+    """
+
+    def __init__(self, name: str, workers: int = 8, max_depth: int = 1000):
+        self.name = name
+        self.workers = workers
+        self.max_depth = max_depth
+
+        self._queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=max_depth)
+        self._tasks: List[asyncio.Task] = []
+
+        # Метрики
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth_seen = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, func: Callable[..., Awaitable[Any]], *args) -> None:
+        """Поставить задачу в очередь; при переполнении — QueueFullError"""
+        try:
+            self._queue.put_nowait((time.monotonic(), func, args))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Очередь {self.name} заполнена ({self.max_depth})")
+        self.submitted += 1
+        self.max_depth_seen = max(self.max_depth_seen, self._queue.qsize())
+
+    def stats(self) -> dict:
+        started = self.processed + self.failed
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "max_depth_seen": self.max_depth_seen,
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_avg_ms": round(self.wait_time_total / started * 1000, 2) if started else 0.0,
+            "wait_max_ms": round(self.wait_time_max * 1000, 2),
+        }
+
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            logger.info(f"Очередь {self.name} запущена: {self.workers} воркеров, глубина до {self.max_depth}")
+
+    async def stop(self, timeout: Optional[float] = 30.0) -> None:
+        """Дождаться выполнения принятых задач и остановить воркеры"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь {self.name}: не дождались {self.depth} задач при остановке")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Очередь {self.name} остановлена")
+
+    async def _worker(self) -> None:
+        while True:
+            enqueued_at, func, args = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            self.wait_time_total += wait
+            self.wait_time_max = max(self.wait_time_max, wait)
+            try:
+                await func(*args)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка задачи в очереди {self.name}: {e}")
+            finally:
+                self._queue.task_done()